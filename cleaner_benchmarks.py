@@ -0,0 +1,399 @@
+"""
+Benchmarks for the wikitext cleaners in regex_cleaners.py.
+
+Cleaners are timed on synthetic wikitext from generate_wikitext(), which strings together
+the same kinds of markup the real pages use (Infoboxes, sortable wikitables, quotes, notice
+boxes, lots of links, ...) from a seeded random generator, so every run cleans the exact
+same text. Each cleaner is timed at several document sizes, and a power law
+time = c * size^k is fitted to the timings: k near 1 means linear scaling, k near 2 means
+something went quadratic.
+
+Run this file to print the timings and compare them to the stored baseline; it exits with
+an error if a cleaner got slower than the baseline allows or scales worse than
+MAX_SCALING_EXPONENT. Run it with --save-baseline to store the current timings as the new
+baseline (timings are machine specific, so save one on the machine that checks against it).
+
+Run it with --fuzz to clean deliberately broken markup instead (unclosed brackets, runaway
+templates, randomly mangled synthetic pages) and check that no page crashes, takes longer
+than regex_cleaners.CLEAN_TIME_BUDGET or scales worse than MAX_SCALING_EXPONENT.
+"""
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import regex_cleaners
+
+BENCHMARK_SEED = 2024
+BENCHMARK_SIZES = [16_000, 128_000, 1_000_000, 4_000_000] # characters of wikitext
+BENCHMARK_REPEATS = 3 # best of this many runs is kept
+BASELINE_PATH = "cleaner_benchmark_baseline.json"
+REGRESSION_TOLERANCE = 1.5 # fail when a timing is this many times the baseline timing
+MIN_REGRESSION_SECONDS = 0.01 # timings shorter than this are too noisy to fail on
+MAX_SCALING_EXPONENT = 1.3 # fail when a cleaner scales worse than size^this
+
+def _tokenizer_cycle(wikitext: str) -> str:
+    return regex_cleaners.deformat_cycle_uncached(wikitext, "tokenizer")
+
+BENCHMARKED_CLEANERS = {
+    "deformat_infobox_entity": regex_cleaners.deformat_infobox_entity,
+    "deformat_wikitable": regex_cleaners.deformat_wikitable,
+    "deformat_quotes": regex_cleaners.deformat_quotes,
+    "deformat_links": regex_cleaners.deformat_links,
+    "deformat_misc": regex_cleaners.deformat_misc,
+    # the memoized deformat_cycle() would only time its cache after the first repeat
+    "deformat_cycle": regex_cleaners.deformat_cycle_uncached,
+    "deformat_cycle_regex": regex_cleaners.deformat_cycle_regex,
+    "deformat_cycle_tokenizer": _tokenizer_cycle,
+}
+
+WORDS = ["the", "empire", "of", "river", "ancient", "city", "war", "trade", "and", "magic",
+         "northern", "council", "was", "founded", "by", "its", "people", "in", "year", "dragon",
+         "sea", "fleet", "temple", "scholars", "believe", "that", "a", "great", "storm"]
+PAGE_NAMES = ["Aldmere", "The Silver Coast", "Order of the Lantern", "Kethra", "First Age",
+              "Iron Pact", "Sunken Library", "Vael River", "House Morrow", "Glass Desert"]
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def _link(rng: random.Random) -> str:
+    """
+    One link of a random kind.
+    """
+    page = rng.choice(PAGE_NAMES)
+    kind = rng.random()
+    if kind < 0.4:
+        return f"[[{page}]]"
+    if kind < 0.7:
+        return f"[[{page}|{_words(rng, rng.randint(1, 3))}]]"
+    if kind < 0.8:
+        return f"[https://example.org/{rng.randint(1, 9999)} {_words(rng, 2)}]"
+    if kind < 0.9:
+        return f"[[Category:{page}]]"
+    return f"[[File:{page.replace(' ', '_')}.png|thumb|{_words(rng, 4)}]]"
+
+def _paragraph(rng: random.Random) -> str:
+    """
+    A paragraph of text, densely linked and sprinkled with bold and italics.
+    """
+    pieces = []
+    for _ in range(rng.randint(20, 60)):
+        roll = rng.random()
+        if roll < 0.25:
+            pieces.append(_link(rng))
+        elif roll < 0.3:
+            pieces.append(f"'''{_words(rng, 2)}'''")
+        elif roll < 0.35:
+            pieces.append(f"''{_words(rng, 2)}''")
+        elif roll < 0.37:
+            pieces.append("<br>")
+        else:
+            pieces.append(rng.choice(WORDS))
+    return " ".join(pieces) + "\n\n"
+
+def _infobox(rng: random.Random) -> str:
+    """
+    An Infobox entity whose values hold links and templates of their own.
+    """
+    xibs = ["{{xib_param\n | header = " + rng.choice(PAGE_NAMES) + " }}"]
+    for _ in range(rng.randint(3, 10)):
+        value = rng.choice([_words(rng, 3), _link(rng), "placeholder",
+                            f"{_words(rng, 2)}<br>{_link(rng)}"])
+        xibs.append("{{xib_param\n | label = " + _words(rng, 1).title()
+                    + " | data = " + value + " }}")
+    return "{{Infobox entity\n" + "\n".join(xibs) + "\n}}\n}}\n"
+
+def _wikitable(rng: random.Random) -> str:
+    """
+    A wikitable, sortable or not, with a title, a header row and linked cells.
+    """
+    columns = rng.randint(2, 5)
+    sortable = " sortable" if rng.random() < 0.5 else ""
+    lines = [f"{{| class=\"wikitable{sortable}\"", f"|+ {_words(rng, 3)}", "|-",
+             "! " + " !! ".join(_words(rng, 1).title() for _ in range(columns))]
+    for _ in range(rng.randint(2, 12)):
+        lines.append("|-")
+        lines.append("| " + " || ".join(rng.choice([_words(rng, 2), _link(rng)])
+                                        for _ in range(columns)))
+    return "\n".join(lines) + "\n|}\n"
+
+def _quote(rng: random.Random) -> str:
+    return ("{{Quote\n | quote = " + _words(rng, rng.randint(5, 25)) + " " + _link(rng)
+            + "\n | speaker = " + rng.choice(PAGE_NAMES) + "\n | source =\n}}\n")
+
+def _notice(rng: random.Random) -> str:
+    return ("{{Notice\n | header =\n" + _words(rng, 3) + "\n | text = " + _words(rng, 15)
+            + "\n}}\n")
+
+def _heading(rng: random.Random) -> str:
+    equals = "=" * rng.randint(2, 4)
+    return f"{equals} {_words(rng, 2).title()} {equals}\n"
+
+def _collapsible(rng: random.Random) -> str:
+    return ("<div class=\"mw-collapsible mw-collapsed\" data-expandtext=\"Show\">\n"
+            + _paragraph(rng) + "</div>\n")
+
+BLOCK_WEIGHTS = [(_paragraph, 10), (_heading, 3), (_infobox, 1), (_wikitable, 2),
+                 (_quote, 1), (_notice, 1), (_collapsible, 1)]
+
+def generate_wikitext(size: int, seed: int = BENCHMARK_SEED) -> str:
+    """
+    Generates synthetic wikitext that looks like a page of the wiki.
+
+    ## Parameters
+    size: roughly how many characters to generate (the last block can run a little over).
+    seed: the random seed; the same seed and size always give the same text.
+    ## Returns
+    the generated wikitext.
+    """
+    rng = random.Random(seed)
+    blocks, weights = zip(*BLOCK_WEIGHTS)
+    pieces = []
+    length = 0
+    while length < size:
+        piece = rng.choices(blocks, weights)[0](rng)
+        pieces.append(piece)
+        length += len(piece)
+    return "".join(pieces)
+
+def time_cleaner(cleaner, wikitext: str, repeats: int = BENCHMARK_REPEATS) -> float:
+    """
+    Returns the best of several timings of a cleaner on a text, in seconds.
+    """
+    best = math.inf
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        cleaner(wikitext)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def scaling_exponent(sizes: list[int], timings: list[float]) -> float:
+    """
+    Fits time = c * size^k by least squares on a log-log scale and returns k.
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(timing, 1e-9)) for timing in timings]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    covariance = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys))
+    variance = sum((x - x_mean) ** 2 for x in xs)
+    return covariance / variance
+
+def run_benchmarks(sizes: list[int] = BENCHMARK_SIZES, cleaners: dict = None) -> dict:
+    """
+    Times every cleaner at every size and prints a table of the results.
+
+    ## Parameters
+    sizes: document sizes to generate, in characters.
+    cleaners: name -> cleaning function. Defaults to BENCHMARKED_CLEANERS.
+    ## Returns
+    a dict of cleaner name -> {"sizes", "timings", "exponent"}, as stored in the baseline.
+    """
+    if cleaners is None:
+        cleaners = BENCHMARKED_CLEANERS
+    documents = {size: generate_wikitext(size) for size in sizes}
+    results = {}
+    print(f"{'cleaner':<26}" + "".join(f"{size:>12,}" for size in sizes) + "   exponent")
+    for name, cleaner in cleaners.items():
+        timings = [time_cleaner(cleaner, documents[size]) for size in sizes]
+        exponent = scaling_exponent(sizes, timings)
+        results[name] = {"sizes": sizes, "timings": timings, "exponent": exponent}
+        print(f"{name:<26}" + "".join(f"{timing:>11.4f}s" for timing in timings)
+              + f"   {exponent:8.2f}")
+    return results
+
+def check_results(results: dict, baseline: dict) -> list[str]:
+    """
+    Compares benchmark results to the baseline and the scaling limit.
+
+    ## Returns
+    a list of problems found, empty if everything is within bounds.
+    """
+    problems = []
+    for name, result in results.items():
+        if result["exponent"] > MAX_SCALING_EXPONENT:
+            problems.append(f"{name} scales as size^{result['exponent']:.2f}, "
+                            f"over the limit of {MAX_SCALING_EXPONENT}")
+        if name not in baseline:
+            continue
+        baseline_timings = dict(zip(baseline[name]["sizes"], baseline[name]["timings"]))
+        for size, timing in zip(result["sizes"], result["timings"]):
+            allowed = baseline_timings.get(size, math.inf) * REGRESSION_TOLERANCE
+            if timing > max(allowed, MIN_REGRESSION_SECONDS):
+                problems.append(f"{name} took {timing:.4f}s on {size:,} characters, "
+                                f"baseline allows {allowed:.4f}s")
+    return problems
+
+# broken markup that used to send the cleaners into heavy backtracking or deep recursion,
+# each built from k repeats of a snippet
+ADVERSARIAL_CASES = {
+    "unterminated_quote": lambda k: "{{Quote | quote = " + "x\n | speaker = y" * k,
+    "quote_with_extra_params": lambda k: "{{Quote " + "| quote = x\n | speaker = y\n" * k + "}}",
+    "notice_with_extra_params": lambda k: "{{Notice" + " | header = a\n | text = b" * k + " x}}",
+    "unterminated_infoboxes": lambda k: "{{Infobox entity\n" * k,
+    "infobox_without_xibs": lambda k: "{{Infobox entity\n" + "data = x |" * k,
+    "nested_links": lambda k: "[[" * k + "x" + "]]" * k,
+    "nested_templates": lambda k: "{{Quote" * k + "}}" * k,
+    "unclosed_links": lambda k: "[[a|" * k,
+    "unclosed_external_links": lambda k: "[http://a " * k,
+    "unclosed_headings": lambda k: "=== a " * k,
+    "unclosed_tables": lambda k: '{| class="wikitable"\n' * k,
+    "one_line_table": lambda k: '{| class="wikitable"\n' + "| a " * k + "|}",
+    "unclosed_html_tags": lambda k: "<div a " * k,
+    # well-formed, but each of these used to rescan the rest of the line in the regex passes
+    "links_without_display_text": lambda k: "[[User:X]] " * k,
+    "divs_without_expandtext": lambda k: "<div a> " * k,
+    "unclosed_file_links": lambda k: "[[File:x " * k + "\n" + "]]" * k,
+    "links_before_a_colon": lambda k: "[[a " * k + "[[User:X]]" + "]]" * k,
+}
+ADVERSARIAL_REPEATS = [500, 2000, 8000, 32000]
+# html.parser itself goes quadratic on these; the deadline in deformat_cycle() bounds them
+DEADLINE_BOUNDED_CASES = {"unclosed_html_tags"}
+FUZZ_DOCUMENTS = 20 # randomly broken synthetic pages to clean
+FUZZ_SIZE = 200_000 # characters per broken page
+FUZZ_MUTATIONS = 200 # random edits per broken page
+FUZZ_SLACK_SECONDS = 1.0 # time past CLEAN_TIME_BUDGET a page may take (the cheap fallback)
+FUZZ_REPEATS = 3 # best of this many runs is kept for each adversarial case
+# the exponent is only fitted over the timings above this, and only when there are two of
+# them: a few hundred microseconds of scheduler noise on a sub-millisecond timing can fake
+# size^1.4
+MIN_FIT_SECONDS = 0.005
+# closers that a mutation may drop and openers it may duplicate
+MUTATION_CLOSERS = ["]]", "}}", "|}", "</div>", "'''", "==", "]"]
+MUTATION_OPENERS = ["[[", "{{", "{|", "<div ", "'''", "==", "[http://a "]
+
+def mutate_wikitext(wikitext: str, rng: random.Random, mutations: int = FUZZ_MUTATIONS) -> str:
+    """
+    Breaks wikitext the way a careless edit would: drops closing brackets and duplicates
+    or inserts opening ones at random places.
+    """
+    for _ in range(mutations):
+        position = rng.randrange(len(wikitext))
+        if rng.random() < 0.5:
+            closer = rng.choice(MUTATION_CLOSERS)
+            found = wikitext.find(closer, position)
+            if found != -1:
+                wikitext = wikitext[:found] + wikitext[found + len(closer):]
+        else:
+            opener = rng.choice(MUTATION_OPENERS) * rng.randint(1, 20)
+            wikitext = wikitext[:position] + opener + wikitext[position:]
+    return wikitext
+
+def time_page_clean(cleaner, wikitext: str) -> tuple[float, str]:
+    """
+    Times one run of a cleaner on a text.
+
+    ## Returns
+    the time in seconds, and the error the cleaner raised (or None).
+    """
+    start_time = time.perf_counter()
+    try:
+        cleaner(wikitext)
+        error = None
+    except Exception as exc: # any crash on broken markup is a finding
+        error = repr(exc)
+    return time.perf_counter() - start_time, error
+
+def run_fuzz(cleaner=regex_cleaners.deformat_cycle_uncached,
+             seed: int = BENCHMARK_SEED) -> list[str]:
+    """
+    Cleans the ADVERSARIAL_CASES at growing sizes (best of FUZZ_REPEATS runs) and a batch of
+    randomly broken synthetic pages, printing the timings. The scaling exponent is only
+    fitted over the timings long enough to measure (MIN_FIT_SECONDS).
+
+    ## Parameters
+    cleaner: the cleaning function to check, deformat_cycle_uncached() by default.    
+    seed: the random seed for the broken pages.
+    ## Returns
+    a list of problems found: crashes, pages over the time budget, and cases that scale
+    worse than MAX_SCALING_EXPONENT.
+    """
+    problems = []
+    time_limit = (regex_cleaners.CLEAN_TIME_BUDGET or math.inf) + FUZZ_SLACK_SECONDS
+    print(f"{'adversarial case':<26}" + "".join(f"{k:>12,}" for k in ADVERSARIAL_REPEATS)
+          + "   exponent")
+    for name, make in ADVERSARIAL_CASES.items():
+        documents = [make(k) for k in ADVERSARIAL_REPEATS]
+        timings = []
+        for document in documents:
+            best = math.inf
+            for _ in range(FUZZ_REPEATS):
+                timing, error = time_page_clean(cleaner, document)
+                best = min(best, timing)
+                if error is not None:
+                    problems.append(f"{name} crashed on {len(document):,} characters: {error}")
+                    break
+            timings.append(best)
+            if best > time_limit:
+                problems.append(f"{name} took {best:.2f}s on {len(document):,} characters, "
+                                f"over the limit of {time_limit:.2f}s")
+        line = f"{name:<26}" + "".join(f"{timing:>11.4f}s" for timing in timings)
+        measurable = [(len(document), timing) for document, timing in zip(documents, timings)
+                      if timing > MIN_FIT_SECONDS]
+        if len(measurable) < 2:
+            # too fast to tell noise from scaling, the time limit above still applies
+            print(line + f"   {'-':>8}")
+            continue
+        exponent = scaling_exponent(*zip(*measurable))
+        print(line + f"   {exponent:8.2f}")
+        if exponent > MAX_SCALING_EXPONENT and name not in DEADLINE_BOUNDED_CASES:
+            problems.append(f"{name} scales as size^{exponent:.2f}, "
+                            f"over the limit of {MAX_SCALING_EXPONENT}")
+
+    rng = random.Random(seed)
+    slowest = 0.0
+    for index in range(FUZZ_DOCUMENTS):
+        document = mutate_wikitext(generate_wikitext(FUZZ_SIZE, seed + index), rng)
+        timing, error = time_page_clean(cleaner, document)
+        slowest = max(slowest, timing)
+        if error is not None:
+            problems.append(f"broken page {index} crashed: {error}")
+        if timing > time_limit:
+            problems.append(f"broken page {index} took {timing:.2f}s, "
+                            f"over the limit of {time_limit:.2f}s")
+    print(f"Cleaned {FUZZ_DOCUMENTS} randomly broken pages of {FUZZ_SIZE:,} characters, "
+          f"slowest took {slowest:.4f}s")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wikitext cleaners.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"store the timings in {BASELINE_PATH} instead of checking them")
+    parser.add_argument("--fuzz", action="store_true",
+                        help="clean broken and adversarial markup instead, checking that "
+                             "every page stays within the cleaning time budget")
+    args = parser.parse_args()
+
+    if args.fuzz:
+        problems = run_fuzz()
+        for problem in problems:
+            print("FUZZ FAILURE:", problem)
+        if problems:
+            sys.exit(1)
+        print("All broken pages cleaned within bounds")
+        return
+
+    results = run_benchmarks()
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {BASELINE_PATH}")
+        return
+
+    try:
+        with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {BASELINE_PATH}, only checking scaling "
+              "(run with --save-baseline to store one)")
+        baseline = {}
+    problems = check_results(results, baseline)
+    for problem in problems:
+        print("REGRESSION:", problem)
+    if problems:
+        sys.exit(1)
+    print("All cleaners within bounds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Checks the single-pass cleaner (the "tokenizer" mode of regex_cleaners.deformat_cycle) against
+the chain of regex passes (regex_cleaners.deformat_cycle_regex) on the scraped wikitext files,
+and the fast HTML stripper against BeautifulSoup (see html_stripper.py).
+
+The two cleaners should agree on every page except where the old patterns cut nested markup
+short (a link inside a file caption, a template inside a notice box, ...), so any page listed
+here is worth a look before trusting the new output. The two HTML strippers should always
+agree.
+
+This script requires some local files generated by the API calls.
+"""
+import time
+import regex_cleaners
+import html_stripper
+from page_files import wikitext_files
+
+CONTEXT_CHARS = 60 # how much text to print on each side of the first difference
+
+def first_difference(old: str, new: str) -> int:
+    """
+    Returns the index of the first character where two texts differ.
+    """
+    for index, (old_char, new_char) in enumerate(zip(old, new)):
+        if old_char != new_char:
+            return index
+    return min(len(old), len(new))
+
+def validate_cleaners(paths: list[str] = None) -> list[str]:
+    """
+    Cleans every given wikitext file with both cleaners and prints where they disagree,
+    along with how long each cleaner took.
+
+    ## Parameters
+    paths: the W files to check. Defaults to every scraped W file.
+    ## Returns
+    the paths of the files whose cleaned text differs.
+    """
+    if paths is None:
+        paths = wikitext_files()
+    mismatches = []
+    regex_time = 0.0
+    single_pass_time = 0.0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            wikitext = f.read()
+        start_time = time.perf_counter()
+        old = regex_cleaners.deformat_cycle_regex(wikitext)
+        regex_time += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        new = regex_cleaners.deformat_cycle_uncached(wikitext, "tokenizer")
+        single_pass_time += time.perf_counter() - start_time
+        if old != new:
+            mismatches.append(path)
+            index = first_difference(old, new)
+            low, high = max(0, index - CONTEXT_CHARS), index + CONTEXT_CHARS
+            print(f"{path}: differs at character {index}")
+            print(f"    regex:       {old[low:high]!r}")
+            print(f"    single pass: {new[low:high]!r}")
+    print(f"{len(paths) - len(mismatches)}/{len(paths)} files match")
+    print(f"regex cleaner: {regex_time:.3f}s, single pass cleaner: {single_pass_time:.3f}s")
+    return mismatches
+
+def validate_html_strippers(paths: list[str] = None) -> list[str]:
+    """
+    Strips the HTML from every given wikitext file (after cleaning the wikitext) in both
+    html_stripper modes and prints where they disagree, along with how long each took.
+
+    ## Parameters
+    paths: the W files to check. Defaults to every scraped W file.
+    ## Returns
+    the paths of the files whose stripped text differs.
+    """
+    if paths is None:
+        paths = wikitext_files()
+    mismatches = []
+    mode_times = {"bs4": 0.0, "fast": 0.0}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = regex_cleaners.tokenize_wikitext(f.read())
+        stripped = {}
+        for mode in mode_times:
+            start_time = time.perf_counter()
+            stripped[mode] = html_stripper.strip_html(text, mode)
+            mode_times[mode] += time.perf_counter() - start_time
+        if stripped["bs4"] != stripped["fast"]:
+            mismatches.append(path)
+            index = first_difference(stripped["bs4"], stripped["fast"])
+            low, high = max(0, index - CONTEXT_CHARS), index + CONTEXT_CHARS
+            print(f"{path}: differs at character {index}")
+            print(f"    bs4:  {stripped['bs4'][low:high]!r}")
+            print(f"    fast: {stripped['fast'][low:high]!r}")
+    print(f"{len(paths) - len(mismatches)}/{len(paths)} files match")
+    print(f"bs4 stripper: {mode_times['bs4']:.3f}s, fast stripper: {mode_times['fast']:.3f}s")
+    return mismatches
+
+if __name__ == "__main__":
+    validate_cleaners()
+    validate_html_strippers()
@@ -0,0 +1,161 @@
+"""
+Contains the exporter that writes the datasets made by datasets_creation.py to disk.
+
+The frames come straight from the producer functions, and every format is written once per
+dataset:
+- csv: the files the Tableau dashboard reads.
+- parquet and feather: keep the column types (datetimes stay datetimes), so reloading a
+dataset (see load_dataset()) is fast and needs no date parsing. Both need pyarrow.
+- xlsx: a workbook per dataset, and combined_xlsx: every dataset as a sheet of one combined
+workbook. Both are written row by row through xlsxwriter's constant memory mode, so memory
+stays flat however long the revisions table gets.
+
+pyarrow and xlsxwriter are optional: formats whose library is not installed are skipped
+with a message instead of failing the whole export.
+"""
+import os
+import importlib.util
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DATASETS_PATH = "datasets/"
+DATASET_SHEETS = {"main_pages_df": "Main Pages",
+                  "discussion_notes_df": "Discussion Notes",
+                  "revisions_df": "Revisions"}
+DATE_COLUMNS = ["Timestamp", "Last Edited Time"] # parsed back into datetimes from CSV
+EXPORT_FORMATS = ["csv", "parquet"] # what datasets_creation.main() writes
+FORMAT_DEPENDENCIES = {"csv": None, "parquet": "pyarrow", "feather": "pyarrow",
+                       "xlsx": "xlsxwriter", "combined_xlsx": "xlsxwriter"}
+COMBINED_EXCEL_FILENAME = "combined_dataset.xlsx"
+EXCEL_DATE_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+def format_available(export_format: str) -> bool:
+    """
+    Returns whether the library an export format needs is installed, without importing it.
+    """
+    if export_format not in FORMAT_DEPENDENCIES:
+        raise ValueError(f"Unknown export format {export_format!r}, expected one of "
+                         f"{', '.join(FORMAT_DEPENDENCIES)}")
+    dependency = FORMAT_DEPENDENCIES[export_format]
+    return dependency is None or importlib.util.find_spec(dependency) is not None
+
+def dataset_path(name: str, export_format: str) -> str:
+    """
+    Returns where a dataset is written in a given format, e.g. datasets/revisions_df.parquet.
+    """
+    return f"{DATASETS_PATH}{name}.{export_format}"
+
+def export_datasets(frames: dict[str, "pd.DataFrame"], formats: list[str] = None) -> list[str]:
+    """
+    Writes every dataset once in every requested format.
+
+    ## Parameters
+    frames: dataset name (see DATASET_SHEETS) -> DataFrame, as returned by the producers.
+    formats: the formats to write (see FORMAT_DEPENDENCIES), EXPORT_FORMATS by default.
+    ## Returns
+    the paths of the files written.
+    """
+    if formats is None:
+        formats = EXPORT_FORMATS
+    written = []
+    for export_format in formats:
+        if not format_available(export_format):
+            print(f"Skipping {export_format} export, {FORMAT_DEPENDENCIES[export_format]} "
+                  "is not installed")
+            continue
+        if export_format == "combined_xlsx":
+            path = DATASETS_PATH + COMBINED_EXCEL_FILENAME
+            write_excel({DATASET_SHEETS.get(name, name): df for name, df in frames.items()},
+                        path)
+            written.append(path)
+            continue
+        for name, df in frames.items():
+            path = dataset_path(name, export_format)
+            if export_format == "csv":
+                df.to_csv(path, index=False)
+            elif export_format == "parquet":
+                df.to_parquet(path, index=False)
+            elif export_format == "feather":
+                df.reset_index(drop=True).to_feather(path)
+            elif export_format == "xlsx":
+                write_excel({DATASET_SHEETS.get(name, name): df}, path)
+            written.append(path)
+    for path in written:
+        print(f"Wrote {path}")
+    return written
+
+def write_excel(sheets: dict[str, "pd.DataFrame"], path: str):
+    """
+    Writes DataFrames as the sheets of one Excel workbook, streaming the rows out with
+    xlsxwriter's constant memory mode.
+
+    pandas' own to_excel() cannot be used for this: it writes column by column, and in
+    constant memory mode xlsxwriter only keeps the current row, so it would drop cells.
+
+    ## Parameters
+    sheets: sheet name -> DataFrame.
+    path: the .xlsx file to write.
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True,
+                                          "default_date_format": EXCEL_DATE_FORMAT,
+                                          "remove_timezone": True})
+    try:
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, [str(column) for column in df.columns])
+            columns = [_excel_values(df[column]) for column in df.columns]
+            for row_number, row in enumerate(zip(*columns), start=1):
+                worksheet.write_row(row_number, 0, row)
+    finally:
+        workbook.close()
+
+def _excel_values(column: "pd.Series") -> list:
+    """
+    Turns a column into plain Python values xlsxwriter can write, with missing values
+    (NaN, NaT) as None so they become empty cells.
+    """
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(column):
+        values = list(column.dt.to_pydatetime())
+    else:
+        values = column.tolist()
+    if column.hasnans:
+        missing = column.isna().tolist()
+        values = [None if is_missing else value for value, is_missing in zip(values, missing)]
+    return values
+
+def load_dataset(name: str) -> "pd.DataFrame":
+    """
+    Reads a dataset back from disk: the revisions come from the revision store once it
+    holds any (see revision_store.py). Otherwise a dataset is read from its Parquet or
+    Feather file if one was written (no older than the CSV) and pyarrow is installed, or
+    from its CSV with the date columns parsed.
+
+    ## Parameters
+    name: the dataset name, e.g. "revisions_df".
+    ## Returns
+    the dataset as a DataFrame.
+    """
+    import pandas as pd
+
+    if name == "revisions_df" and format_available("parquet"):
+        import revision_store
+        if not revision_store.is_empty():
+            return revision_store.load_revisions()
+    csv_path = dataset_path(name, "csv")
+    csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else 0
+    for export_format, reader in [("parquet", pd.read_parquet), ("feather", pd.read_feather)]:
+        path = dataset_path(name, export_format)
+        if os.path.exists(path) and os.path.getmtime(path) >= csv_mtime and \
+                format_available(export_format):
+            return reader(path)
+    df = pd.read_csv(csv_path)
+    for colname in DATE_COLUMNS:
+        if colname in df.columns:
+            df[colname] = pd.to_datetime(df[colname])
+    return df
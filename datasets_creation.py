@@ -33,34 +33,63 @@ time) and to different page or revision IDs.
 # import re
 # import json
 # import requests
-import pandas as pd
-# static variables that lead to where the source material is located at.
+from typing import TYPE_CHECKING
+# pandas is imported by the functions that use it, so importing this file stays fast
 # from bs4 import BeautifulSoup
 # from typing import Tuple, List
-import secret_variables
 import mediawiki_api_calls
 import pandas_df_funcs
+import page_files
+import dataset_export
+import revision_store
+import revisions_journal
+import pipeline
+
+if TYPE_CHECKING:
+    import pandas as pd
 
-API_ENDPOINT = secret_variables.WIKI_URL + "/w/api.php"
 SCRAPED_FILES_PATH = "pages/"
 DATASETS_PATH = "datasets/"
 NOTES_PATH = "pages/notes/"
 NOTES_DATE_FINDER_REGEX = r"[0-9]{4} EST, [0-9]{2} [a-zA-Z]* [0-9]{4}"
 ROUNDING_PRECISION = 3
 
-pageids = mediawiki_api_calls.getallpageids()
-pageids.sort()
-def produce_mainpages_df():
+_pageids = None
+
+def get_pageids() -> list[int]:
+    """
+    Returns the sorted IDs of every page in the datasets (the category pages, the discussion
+    page and the userpage, see _category_snapshot()), asking the API on first use only, so
+    importing this file does not need the network.
+    """
+    global _pageids
+    if _pageids is None:
+        # within a pipeline run, the snapshot the other stages use
+        _pageids = sorted(pipeline.input_value(_category_snapshot))
+    return _pageids
+
+def produce_mainpages_df(metadata: dict = None) -> "pd.DataFrame":
     """
     Placeholder
+
+    ## Parameters
+    metadata: default None; the category snapshot to build the dataset from (see
+    _category_snapshot()), taken from the API if not given.
+    ## Returns
+    the main pages dataset, to be written out by dataset_export.export_datasets().
     """
+    import pandas as pd
+    import secret_variables
+    if metadata is None:
+        metadata = _category_snapshot()
+    mainpage_ids = sorted(metadata)
     altcats = []
     pagenames = []
-    for pageid in pageids:
-        altcat = mediawiki_api_calls.get_categories(pageid)
-        altcats.append(pandas_df_funcs.altcat_cleanup(altcat))
-        title = mediawiki_api_calls.get_pageinfo(pageid)["title"]
-        pagenames.append(pandas_df_funcs.pagename_cleanup(title))
+    lastedits = []
+    for pageid in mainpage_ids:
+        altcats.append(pandas_df_funcs.altcat_cleanup(metadata[pageid]["categories"]))
+        pagenames.append(pandas_df_funcs.pagename_cleanup(metadata[pageid]["title"]))
+        lastedits.append(metadata[pageid]["lastedit"])
 
     # print("pageids:")
     # print(pageids)
@@ -68,15 +97,14 @@ def produce_mainpages_df():
     # print(altcats)
 
     wordc, bytec, cfp, wordlen = [], [], [], []
-    for pageid in pageids:
-        #print(pageid)
-        w, b, c, l = pandas_df_funcs.wordbytescount(pageid)
+    # every page's files are counted in parallel up front
+    for w, b, c, l in pandas_df_funcs.wordbytescounts(mainpage_ids):
         wordc.append(w)
         bytec.append(b)
         cfp.append(c * 100)
         wordlen.append(l)
-    customnotetypes = ["Placeholder"] * len(pageids)
-    pages_df = pd.DataFrame({"Page ID": pageids,
+    customnotetypes = ["Placeholder"] * len(mainpage_ids)
+    pages_df = pd.DataFrame({"Page ID": mainpage_ids,
                             "Page Name": pagenames,
                             "Other Category": altcats,
                             "Word Count": wordc,
@@ -88,13 +116,8 @@ def produce_mainpages_df():
                             })
     for colname in ["Content to Formatting Percent", "Average Word Length"]:
         pages_df[colname] = pages_df[colname].round(ROUNDING_PRECISION)
-    pages_df["Last Edited Time"] = pages_df["Page ID"].apply(lambda pageid:
-                                                    pd.to_datetime(mediawiki_api_calls
-                                                                    .get_page_lastedit(pageid))
-                                                                    .tz_convert(None)
-                                                                    )
-
-    pages_df["Last Edited Time"] = pd.to_datetime(pages_df["Last Edited Time"])
+    pages_df["Last Edited Time"] = pd.to_datetime(pd.Series(lastedits),
+                                                  utc=True).dt.tz_convert(None)
     pages_df["Last Edited Time"] = pages_df["Last Edited Time"] - pd.Timedelta(hours=5)
     pages_df["Is Discussion Notes"] = pages_df["Page Name"].apply(lambda pagename:
                                                                   "Userpage" in pagename
@@ -102,35 +125,30 @@ def produce_mainpages_df():
     # manually set some categories
     for special_ids in [secret_variables.DISCUSSION_ID, secret_variables.USERPAGE_ID]:
         pages_df.loc[pages_df["Page ID"] == special_ids, "Other Category"] = "Documentation"
-    pages_df.drop("Page Name").to_csv(DATASETS_PATH+"main_pages_df.csv", index=False)
+    return pages_df.drop(columns="Page Name")
 
-def produce_notes_df():
+def produce_notes_df() -> "pd.DataFrame":
     """
     Placeholder
+
+    ## Returns
+    the discussion notes dataset, to be written out by dataset_export.export_datasets().
     """
-    notesids = []
-    notenames = []
-    for filename in pandas_df_funcs.noteslist:
-        notesid = int(filename[-9:-5])
-        notename = filename[:-16]
-        # avoid duplicate entries with a check, unless list is empty
-        if not notesids or notesid != notesids[-1]:
-            notesids.append(int(filename[-9:-5]))
-        if not notenames or notename != notenames[-1]:
-            notenames.append(notename)
+    import pandas as pd
+    notes_index = page_files.file_index(NOTES_PATH)
+    notesids = sorted(notes_index)
+    notenames = [notes_index[notesid]["name"] for notesid in notesids]
     #print(notesids)
     notetypes = ["Discussion Notes"] * len(notesids)
     customnotetypes = ["Placeholder"] * len(notesids)
 
-    # regex pulling datetimes for the notes
-    notesdts = []
+    # regex pulling datetimes for all the notes at once
+    notesdts = pandas_df_funcs.get_note_dts(notesids).to_numpy()
     noteswordcounts = []
     notesbytescounts = []
     notescfp = []
     noteswordlen = []
-    for notesid in notesids:
-        notesdts.append(pandas_df_funcs.get_note_dt(notesid))
-        w, b, c, l = pandas_df_funcs.wordbytescount(notesid, isnotes=True)
+    for w, b, c, l in pandas_df_funcs.wordbytescounts(notesids, isnotes=True):
         noteswordcounts.append(w)
         notesbytescounts.append(b)
         notescfp.append(c * 100)
@@ -151,19 +169,18 @@ def produce_notes_df():
         notes_df[colname] = notes_df[colname].round(ROUNDING_PRECISION)
     notes_df["Last Edited Time"] = pd.to_datetime(notes_df["Last Edited Time"])
     notes_df["Last Edited Time"] = notes_df["Last Edited Time"] - pd.Timedelta(hours=5)
-    notes_df.to_csv(DATASETS_PATH+"discussion_notes_df.csv", index=False)
+    return notes_df
 
 #print(mediawiki_api_calls.get_revision_history(583))
 
-def produce_revs_df():
+def produce_revs_df() -> "pd.DataFrame":
     """
-    This function takes a long time to run (in the range of tens of minutes).
-    This is due to the function calling on the API endpoints once per page
-    and once per revision per page. This is further affected by Internet speed
-    which may influence how long it takes to get an API response. Finally this
-    function also pulls the full revision version text at each revision, further
-    slowing the process. However, I don't have any better ways to pull the revision
-    word differences.
+    This function used to take a long time to run (in the range of tens of minutes),
+    calling the API once per page and three times per revision, and deformatting every
+    revision text twice. It now walks each page's history in bulk, oldest to newest,
+    pulling the revision texts up to 50 at a time and deformatting each exactly once
+    (see mediawiki_api_calls.walk_page_revisions()). Byte sizes come from the revision
+    sizes in the same listing (see pandas_df_funcs.revisions_frame()).
 
     Last ran at around 11:30pm 21 May; fixed a bug with get_revision_wordcount since then
     so this will have to be rerun as soon as is reasonable
@@ -175,96 +192,153 @@ def produce_revs_df():
     - is marked as "minor" or not
     - Size of revision (bytes)
     - Size of revision (words)
+
+    The walk runs as a journaled job that resumes where a failed run stopped (see
+    revisions_journal.py). The revision store is then replaced with these revisions (see
+    revision_store.py), so revisions that are gone from the wiki or from the categories
+    are dropped from it too.
+
+    ## Returns
+    the revisions dataset, to be written out by dataset_export.export_datasets().
     """
-    revid_list = []
-    minor_list = []
-    for pageid in pageids + [secret_variables.DISCUSSION_ID, secret_variables.USERPAGE_ID]:
-        hist = mediawiki_api_calls.get_revision_history(pageid)
-        for rev in hist:
-            revid_list.append(rev["revid"]) #"revision id"
-            minor_list.append(rev["minor"])
-    #print(revid_list)
-    pageid_list = []
-    timestamps = []
-    revbytesizes = []
-    revwordsizes = []
-    for revid in revid_list:
-        rev_deets = mediawiki_api_calls.get_revision_deets(revid)
-        pageid_list.append(rev_deets["toid"])
-        # timestamp raw looks like: 2025-04-13T05:14:42Z
-        timestamps.append(pd.to_datetime(rev_deets["totimestamp"]).tz_convert(None))
-        worddiff = mediawiki_api_calls.get_revision_wordcount(revid)
-        revwordsizes.append(worddiff)
-        revbytesizes.append(rev_deets["tosize"]-rev_deets["fromsize"]
-                            if "fromsize" in rev_deets
-                            else rev_deets["tosize"])
-
-    revs_df = pd.DataFrame({
-        "Revision ID": revid_list,
-        "Page ID": pageid_list,
-        "Timestamp": timestamps,
-        "Is Minor": minor_list,
-        "Revision Size (Bytes)": revbytesizes,
-        "Revision Size (Words)": revwordsizes,
-    })
-    revs_df["Timestamp"] = pd.to_datetime(revs_df["Timestamp"])
-    revs_df["Timestamp"] = revs_df["Timestamp"] - pd.Timedelta(hours=5)
-    revs_df.to_csv(DATASETS_PATH+"revisions_df.csv", index=False)
-
-def update_revs_df():
+    # the page IDs already hold the discussion and userpage ids (see getallpageids());
+    # journaled as it goes, so a failure halfway resumes instead of starting over
+    revisions = revisions_journal.run_revisions_job(get_pageids())
+
+    revs_df = pandas_df_funcs.revisions_frame(revisions)
+    revs_df["Revision Size (Words)"] = [rev["worddiff"] for rev in revisions]
+    revs_df = revs_df[pandas_df_funcs.REVISIONS_COLUMNS]
+    revision_store.upsert_revisions(revs_df, replace=True)
+    return revs_df
+
+def update_revs_df() -> "pd.DataFrame":
     """
     Only API query the updates not in the df.
 
     I will have this as a separate func for now. I will update create_rvs_df
     when I have the time.
+
+    The new revisions are appended to the revision store (see revision_store.py), so an
+    update only costs the new revisions, not a rewrite of the whole history.
+
+    ## Returns
+    the whole revisions dataset from the store, to be written out by
+    dataset_export.export_datasets().
     """
-    df = pd.read_csv("datasets/revisions_df.csv", parse_dates=["Timestamp"])
+    if revision_store.is_empty():
+        # first run with the store: seed it with the revisions saved so far
+        revision_store.upsert_revisions(dataset_export.load_dataset("revisions_df"))
     revid_list = []
-    minor_list = []
-    existing_revids = df["Revision ID"].unique()
-    for revision in mediawiki_api_calls.get_recent_revisions():
+    touched_pageids = set()
+    pageids = set(get_pageids())
+    latest_date = revision_store.latest_timestamp()
+    for revision in mediawiki_api_calls.get_recent_revisions(latest_date):
         # work I did outside certain categories no longer count
-        if revision["revid"] not in existing_revids and revision["pageid"] in pageids:
+        if not revision_store.contains(revision["revid"]) and revision["pageid"] in pageids:
             revid_list.append(revision["revid"])
-            minor_list.append("minor" in revision)
-    pageid_list = []
-    timestamps = []
-    revbytesizes = []
-    revwordsizes = []
-    for revid in revid_list:
-        rev_deets = mediawiki_api_calls.get_revision_deets(revid)
-        pageid_list.append(rev_deets["toid"])
-        # timestamp raw looks like: 2025-04-13T05:14:42Z
-        timestamps.append(pd.to_datetime(rev_deets["totimestamp"]).tz_convert(None))
-        worddiff = mediawiki_api_calls.get_revision_wordcount(revid)
-        revwordsizes.append(worddiff)
-        revbytesizes.append(rev_deets["tosize"]-rev_deets["fromsize"]
-                            if "fromsize" in rev_deets
-                            else rev_deets["tosize"])
-    revs_df = pd.DataFrame({
-        "Revision ID": revid_list,
-        "Page ID": pageid_list,
-        "Timestamp": timestamps,
-        "Is Minor": minor_list,
-        "Revision Size (Bytes)": revbytesizes,
-        "Revision Size (Words)": revwordsizes,
-    })
-    revs_df["Timestamp"] = pd.to_datetime(revs_df["Timestamp"])
-    revs_df["Timestamp"] = revs_df["Timestamp"] - pd.Timedelta(hours=5)
+            touched_pageids.add(revision["pageid"])
+    # the byte sizes need each touched page's whole history listing (sizes only, no content)
+    revs_df = pandas_df_funcs.revisions_frame(
+        mediawiki_api_calls.get_revisions_metadata(sorted(touched_pageids)))
+    revs_df = revs_df[revs_df["Revision ID"].isin(revid_list)].copy()
+    # fetched concurrently; results come back in the same order
+    revs_df["Revision Size (Words)"] = mediawiki_api_calls.fetch_revision_worddiffs(
+        revs_df["Revision ID"].tolist(), revs_df["Parent ID"].tolist())
+    revs_df = revs_df[pandas_df_funcs.REVISIONS_COLUMNS]
     #revs_df.to_csv("datasets/new_revs_df.csv", index=False)
-    df = pd.concat([df, revs_df])
-    df.to_csv(DATASETS_PATH+"revisions_df.csv", index=False)
+    revision_store.upsert_revisions(revs_df)
+    return revision_store.load_revisions()
+
+def _category_snapshot() -> dict:
+    """
+    Pipeline input: the metadata of every page in the datasets (titles, categories, latest
+    revisions, sizes), which changes whenever a page is edited, added or recategorized.
+    The scrape and main_pages stages build on the same snapshot (see pipeline.input_value()).
+    """
+    import secret_variables
+    # a handful of requests for the whole category, plus one for the two pages outside it
+    metadata = mediawiki_api_calls.get_category_snapshot()
+    metadata.update(mediawiki_api_calls.get_pages_metadata([secret_variables.DISCUSSION_ID,
+                                                            secret_variables.USERPAGE_ID]))
+    return metadata
+
+def _latest_contribution() -> int:
+    """
+    Pipeline input: the revision ID of my latest edit, which moves with every new revision.
+    """
+    import secret_variables
+    # newest first, so only the first batch is requested
+    for contribution in mediawiki_api_calls.iter_user_contribs(secret_variables.USERNAME,
+                                                                ucprop="ids"):
+        return contribution["revid"]
+    return None
+
+def _scrape():
+    mediawiki_api_calls.scrapecycle(incremental=True,
+                                    metadata=pipeline.input_value(_category_snapshot))
+
+def _export_main_pages():
+    dataset_export.export_datasets(
+        {"main_pages_df": produce_mainpages_df(pipeline.input_value(_category_snapshot))})
+
+def _export_notes():
+    dataset_export.export_datasets({"discussion_notes_df": produce_notes_df()})
+
+def _export_revisions():
+    dataset_export.export_datasets({"revisions_df": produce_revs_df()})
+
+def _export_revisions_update():
+    dataset_export.export_datasets({"revisions_df": update_revs_df()})
+
+# the stages of main(), see pipeline.py. Stages only wait on the ones in their "after" list
+# when both are run, so e.g. "notes" alone works off the pages already on disk.
+PIPELINE_STAGES = {
+    "scrape": {"run": _scrape,
+               "inputs": [_category_snapshot],
+               "outputs": [page_files.MANIFEST_PATH]},
+    "main_pages": {"run": _export_main_pages,
+                   "inputs": [_category_snapshot, SCRAPED_FILES_PATH],
+                   "outputs": [dataset_export.dataset_path("main_pages_df", "csv")],
+                   "after": ["scrape"]},
+    # no network needed, so it runs alongside the API stages
+    "notes": {"run": _export_notes,
+              "inputs": [NOTES_PATH],
+              "outputs": [dataset_export.dataset_path("discussion_notes_df", "csv")],
+              "after": ["scrape"]},
+    "revisions": {"run": _export_revisions_update,
+                  "inputs": [_latest_contribution],
+                  "outputs": [dataset_export.dataset_path("revisions_df", "csv")]},
+    "full_revisions": {"run": _export_revisions,
+                       "inputs": [_category_snapshot],
+                       "outputs": [dataset_export.dataset_path("revisions_df", "csv")],
+                       # both write the revisions dataset, never at the same time
+                       "after": ["revisions"]},
+    "excel": {"run": pandas_df_funcs.compile_single_excel,
+              "inputs": [dataset_export.dataset_path(name, "csv")
+                         for name in dataset_export.DATASET_SHEETS],
+              "outputs": [dataset_export.DATASETS_PATH + dataset_export.COMBINED_EXCEL_FILENAME],
+              "after": ["main_pages", "notes", "revisions", "full_revisions"]},
+}
+DEFAULT_PIPELINE_TARGETS = ["main_pages", "notes"]
 
 def main():
     """
-    Main function.
+    Main function. Runs the given pipeline stages (see PIPELINE_STAGES), by default the
+    main pages and discussion notes datasets, e.g.
+    python datasets_creation.py scrape main_pages notes revisions excel
     """
-    # mediawiki_api_calls.scrapecycle()
-    produce_mainpages_df()
-    produce_notes_df()
-    # produce_revs_df()
-    # update_revs_df()
-    # pandas_df_funcs.compile_single_excel()
+    import argparse
+    parser = argparse.ArgumentParser(description="Builds the datasets.")
+    # not choices=: argparse rejects an empty list of stages against it
+    parser.add_argument("stages", nargs="*",
+                        help=f"the stages to run, out of {', '.join(PIPELINE_STAGES)} "
+                        f"(default {' '.join(DEFAULT_PIPELINE_TARGETS)})")
+    parser.add_argument("--force", action="store_true",
+                        help="run the stages even if their inputs did not change")
+    args = parser.parse_args()
+    pipeline.run_pipeline(PIPELINE_STAGES, args.stages or DEFAULT_PIPELINE_TARGETS,
+                          force=args.force)
+    mediawiki_api_calls.print_api_stats()
 
 if __name__ == "__main__":
     main()
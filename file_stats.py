@@ -0,0 +1,125 @@
+"""
+Contains a statistics engine for the scraped text files: byte count, character count, word
+count and average word length, all from one streaming pass over each file.
+
+Files are read in binary chunks and counted as raw UTF-8 bytes, without decoding them:
+- bytes come from os.stat(), so they are real bytes on disk (a character like "é" is 2).
+- characters are every byte that does not continue a multi-byte character.
+- words follow mediawiki_api_calls.get_wordcount_text(), len(text.strip().split(" ")),
+which is one more than the number of spaces once the whitespace at both ends is stripped.
+A space is always the single byte 0x20 in UTF-8, so only the whitespace at the two ends of
+the file has to be decoded to tell which spaces strip() would drop.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+STATS_CHUNK_BYTES = 1 << 20 # read files 1 MiB at a time
+STATS_WORKERS = os.cpu_count() or 1
+STATS_CHUNKSIZE = 16 # files handed to a worker at a time
+EDGE_BYTES = 64 # how much of a chunk edge is decoded first when looking for whitespace
+
+CONTINUATION_BYTES = bytes(range(0x80, 0xc0)) # the 2nd-4th bytes of a multi-byte character
+_NOT_CONTINUATION = bytes(range(0x80)) + bytes(range(0xc0, 0x100))
+
+def _char_boundary(chunk: bytes) -> int:
+    """
+    Returns where the last whole UTF-8 character of a chunk ends, so that a character split
+    between two chunks can be carried over to the next one.
+    """
+    index = len(chunk) - 1
+    while index > max(len(chunk) - 4, 0) and chunk[index] in CONTINUATION_BYTES:
+        index -= 1
+    if index < 0 or chunk[index] < 0xc0:
+        return len(chunk) # ends on a whole character (or on bytes that are not UTF-8)
+    lead = chunk[index]
+    needed = 2 if lead < 0xe0 else 3 if lead < 0xf0 else 4
+    return index if len(chunk) - index < needed else len(chunk)
+
+def _decode_edge(piece: bytes, leading: bool) -> str:
+    """
+    Decodes the first (leading) or last EDGE_BYTES of a piece of whole characters,
+    dropping the partial character that cutting it may leave at the cut end.
+    """
+    if len(piece) <= EDGE_BYTES:
+        return piece.decode("utf-8", errors="replace")
+    if leading:
+        edge = piece[:EDGE_BYTES]
+        return edge[:_char_boundary(edge)].decode("utf-8", errors="replace")
+    return piece[-EDGE_BYTES:].lstrip(CONTINUATION_BYTES).decode("utf-8", errors="replace")
+
+def _edge_spaces(piece: bytes, leading: bool) -> tuple[int, bool]:
+    """
+    Counts the spaces in the whitespace at the start (leading) or end of a piece.
+
+    ## Returns
+    the number of spaces, and whether the piece is nothing but whitespace.
+    """
+    text = _decode_edge(piece, leading)
+    stripped = text.lstrip() if leading else text.rstrip()
+    if not stripped and len(piece) > EDGE_BYTES:
+        # the whole edge is whitespace; the rest of the piece decides
+        text = piece.decode("utf-8", errors="replace")
+        stripped = text.lstrip() if leading else text.rstrip()
+    if not stripped:
+        return text.count(" "), True
+    if leading:
+        return text[:len(text) - len(stripped)].count(" "), False
+    return text[len(stripped):].count(" "), False
+
+def file_stats(path: str) -> dict:
+    """
+    Reads a text file once, in chunks, and counts its bytes, characters and words.
+
+    ## Parameters
+    path: path to a UTF-8 text file.
+    ## Returns
+    a dict of path, bytes (the size on disk), chars, words (see get_wordcount_text()) and
+    word_length (characters per word, as wordbytescount() has always computed it).
+    """
+    size = os.stat(path).st_size
+    chars = 0
+    spaces = 0
+    leading_spaces = 0
+    in_leading = True # everything so far was whitespace
+    trailing_spaces = 0 # spaces in the whitespace run at the end of what was read so far
+    carry = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(STATS_CHUNK_BYTES)
+            if not chunk:
+                piece, carry = carry, b""
+            else:
+                chunk = carry + chunk
+                boundary = _char_boundary(chunk)
+                piece, carry = chunk[:boundary], chunk[boundary:]
+            if piece:
+                chars += len(piece) - len(piece.translate(None, _NOT_CONTINUATION))
+                spaces += piece.count(b" ")
+                if in_leading:
+                    edge_spaces, all_space = _edge_spaces(piece, leading=True)
+                    leading_spaces += edge_spaces
+                    in_leading = all_space
+                edge_spaces, all_space = _edge_spaces(piece, leading=False)
+                trailing_spaces = trailing_spaces + edge_spaces if all_space else edge_spaces
+            if not chunk:
+                break
+    # "".split(" ") is [""], one word
+    words = 1 if in_leading else spaces - leading_spaces - trailing_spaces + 1
+    return {"path": path, "bytes": size, "chars": chars, "words": words,
+            "word_length": chars / words}
+
+def many_file_stats(paths: list[str], workers: int = STATS_WORKERS) -> dict[str, dict]:
+    """
+    Runs file_stats() over many files at once in a process pool.
+
+    ## Parameters
+    paths: the files to count.
+    workers: how many processes to count with.
+    ## Returns
+    a dict of path -> stats dict (see file_stats()).
+    """
+    if workers <= 1 or len(paths) <= 1:
+        return {path: file_stats(path) for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return {stats["path"]: stats
+                for stats in executor.map(file_stats, paths, chunksize=STATS_CHUNKSIZE)}
@@ -0,0 +1,198 @@
+"""
+Contains a lightweight HTML stripper for the last step of cleaning a page: dropping the
+leftover HTML tags and turning entities like &nbsp; into characters.
+
+This used to be done by building a BeautifulSoup tree just to call get_text() on it.
+TextCollector gets the same text straight out of Python's own HTML parser (which
+BeautifulSoup uses under the hood anyway) without building the tree. The BeautifulSoup
+path is kept as the "bs4" mode to check against, see cleaner_validation.py.
+"""
+import time
+from html.parser import HTMLParser
+from html.entities import html5
+
+HTML_STRIP_MODE = "fast" # "fast" for TextCollector, "bs4" for BeautifulSoup
+ASCII_SPACES = " \n\t\x0c\r"
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+# BeautifulSoup keeps the text inside these tags out of get_text()
+HIDDEN_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+VOID_TAGS = {"area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame",
+             "hr", "image", "img", "input", "isindex", "keygen", "link", "menuitem", "meta",
+             "nextid", "param", "source", "spacer", "track", "wbr"}
+
+# entity names without their semicolon, as html.parser hands them over
+ENTITIES = {}
+for entity_name, entity_text in sorted(html5.items()):
+    ENTITIES.setdefault(entity_name.rstrip(";"), entity_text)
+
+class TextCollector(HTMLParser):
+    """
+    An HTML parser that only collects the text of a document, the same text that
+    BeautifulSoup(text, features="html.parser").get_text() returns.
+
+    Like BeautifulSoup it skips comments, declarations and the contents of script/style
+    tags, and shrinks text that is nothing but whitespace to a single space or newline.
+    """
+    def __init__(self, deadline: float = None):
+        super().__init__(convert_charrefs=False)
+        self.deadline = deadline # a time.perf_counter() time to give up at
+        self.pieces = [] # finished bits of text
+        self._data = [] # the text since the last tag
+        self._open_tags = []
+        self._open_counts = {} # tag -> how many of it are in _open_tags
+        self._closed_void_tags = {} # tag -> how many later closing tags to ignore
+
+    def _end_data(self, keep: bool = None):
+        """
+        Finishes the text since the last tag. keep overrides whether it is kept, by default
+        it is unless it sits inside one of the HIDDEN_TEXT_TAGS.
+        """
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data = []
+        # counted rather than looked up in _open_tags, which a page full of unclosed
+        # <div>s makes as long as the page
+        if not self._inside(PRESERVE_WHITESPACE_TAGS) and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if keep is None:
+            keep = not self._inside(HIDDEN_TEXT_TAGS)
+        if keep:
+            self.pieces.append(data)
+
+    def _inside(self, tags: set) -> bool:
+        """
+        Returns whether any of these tags is open.
+        """
+        return any(self._open_counts.get(tag) for tag in tags)
+
+    def _close_tag(self, tag: str):
+        """
+        Closes the most recent open tag with this name and everything opened after it.
+        """
+        if self._open_counts.get(tag):
+            index = len(self._open_tags) - 1
+            while self._open_tags[index] != tag:
+                index -= 1
+            for closed in self._open_tags[index:]:
+                self._open_counts[closed] -= 1
+            del self._open_tags[index:]
+
+    def _check_deadline(self):
+        # html.parser can go quadratic on a long run of unclosed tags ("<div <div <div ..."),
+        # handing each "<" over as text after scanning the rest of the document for a ">"
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise TimeoutError("ran out of time stripping HTML")
+
+    def handle_starttag(self, tag, attrs):
+        self._check_deadline()
+        self._end_data()
+        if tag in VOID_TAGS:
+            # <br> closes itself, and a later </br> is ignored
+            self._closed_void_tags[tag] = self._closed_void_tags.get(tag, 0) + 1
+        else:
+            self._open_tags.append(tag)
+            self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+
+    def handle_endtag(self, tag):
+        if self._closed_void_tags.get(tag):
+            self._closed_void_tags[tag] -= 1
+            return
+        self._end_data()
+        self._close_tag(tag)
+
+    def handle_data(self, data):
+        self._check_deadline()
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        self._data.extend(numeric_reference(name))
+
+    def handle_entityref(self, name):
+        self._data.append(ENTITIES.get(name, "&" + name))
+
+    def handle_comment(self, data):
+        self._end_data()
+
+    def handle_decl(self, decl):
+        self._end_data()
+
+    def handle_pi(self, data):
+        self._end_data()
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.upper().startswith("CDATA["):
+            self._data.append(data[len("CDATA["):])
+            self._end_data(keep=True)
+
+    def get_text(self) -> str:
+        """
+        Returns all the text collected so far, once the document has been fed in and closed.
+        """
+        self._end_data()
+        return "".join(self.pieces)
+
+def numeric_reference(name: str) -> tuple[str, str]:
+    """
+    Turns the number of a character reference (e.g. "65" or "x41") into its character,
+    following the HTML spec the way BeautifulSoup does.
+
+    ## Returns
+    the character, and any text after the number that was not part of the reference.
+    """
+    base = 10
+    digits = "0123456789"
+    if name[:1] in ("x", "X"):
+        name = name[1:]
+        base = 16
+        digits = "0123456789abcdef"
+    try:
+        number, extra = int(name, base), ""
+    except ValueError:
+        # a reference with no semicolon: only the leading digits count
+        number_length = len(name) - len(name.lstrip(digits))
+        if number_length == 0:
+            return "", name
+        number, extra = int(name[:number_length], base), name[number_length:]
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+        return "\ufffd", extra
+    if 0x80 <= number <= 0x9f:
+        # references to windows-1252 bytes mean the windows-1252 character
+        try:
+            return bytes([number]).decode("cp1252"), extra
+        except UnicodeDecodeError:
+            pass
+    return chr(number), extra
+
+def strip_html(text: str, mode: str = None, deadline: float = None) -> str:
+    """
+    Removes the HTML tags from a block of text and turns entities into characters.
+
+    ## Parameters
+    text: a block of text that may contain HTML.    
+    mode: "fast" or "bs4", see HTML_STRIP_MODE (the default).    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError
+    (only checked in "fast" mode).
+    ## Returns
+    the text without HTML.
+    """
+    if mode is None:
+        mode = HTML_STRIP_MODE
+    if mode == "bs4":
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(text, features="html.parser").get_text()
+    if mode != "fast":
+        raise ValueError(f"Unknown HTML strip mode {mode!r}, expected 'fast' or 'bs4'")
+    if "<" not in text and "&" not in text:
+        # nothing to parse, but whitespace-only text still shrinks like it would in the parser
+        if text.strip(ASCII_SPACES) or not text:
+            return text
+        return "\n" if "\n" in text else " "
+    collector = TextCollector(deadline)
+    collector.feed(text)
+    collector.close()
+    return collector.get_text()
@@ -0,0 +1,98 @@
+"""
+Checks that importing the modules of this project stays fast and free of side effects.
+
+Each module is imported in a fresh interpreter (so nothing is already cached) with the
+network and directory listings booby-trapped: an import that opens a connection or lists a
+folder is reported, as is one that loads one of the HEAVY_MODULES or takes longer than
+IMPORT_BUDGET_SECONDS. Run this file to check every module in CHECKED_MODULES; it exits with
+an error if any of them breaks the rules.
+"""
+import sys
+import json
+import subprocess
+
+IMPORT_BUDGET_SECONDS = 0.5
+# the scripts (wordcount.py, sandbox.py, ...) do their work at import time and are left out
+CHECKED_MODULES = ["page_files", "file_stats", "text_cache", "html_stripper", "regex_cleaners",
+                   "mediawiki_api_calls", "pandas_df_funcs", "dataset_export", "revision_store",
+                   "revisions_journal", "pipeline", "datasets_creation", "cleaner_validation",
+                   "cleaner_benchmarks", "reclean"]
+# imported by the functions that need them, never at import time
+HEAVY_MODULES = ["pandas", "numpy", "requests", "bs4", "pyarrow", "openpyxl", "xlsxwriter"]
+
+# runs in the child interpreter: sys.argv[1] is the module to import
+CHILD_SCRIPT = """
+import os, sys, json, time, socket
+calls = []
+def trap(name, original):
+    def trapped(*args, **kwargs):
+        calls.append(name)
+        return original(*args, **kwargs)
+    return trapped
+os.listdir = trap("os.listdir", os.listdir)
+os.scandir = trap("os.scandir", os.scandir)
+socket.socket.connect = trap("socket.connect", socket.socket.connect)
+socket.getaddrinfo = trap("socket.getaddrinfo", socket.getaddrinfo)
+before = set(sys.modules)
+start_time = time.perf_counter()
+error = None
+try:
+    __import__(sys.argv[1])
+except Exception as exc:
+    error = repr(exc)
+seconds = time.perf_counter() - start_time
+loaded = sorted({name.split(".")[0] for name in set(sys.modules) - before})
+print(json.dumps({"seconds": seconds, "calls": calls, "loaded": loaded, "error": error}))
+"""
+
+def measure_import(module: str) -> dict:
+    """
+    Imports a module in a fresh interpreter and reports what the import did.
+
+    ## Parameters
+    module: the name of the module to import.
+    ## Returns
+    a dict of seconds (how long the import took), calls (trapped directory listings and
+    network calls), loaded (top-level modules the import loaded) and error (None, or the
+    exception the import raised).
+    """
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, module],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def check_imports(modules: list[str] = None) -> list[str]:
+    """
+    Measures the import of every module and prints a line per module.
+
+    ## Parameters
+    modules: the modules to check. Defaults to CHECKED_MODULES.
+    ## Returns
+    a list of problems found, empty if every import is fast and free of side effects.
+    """
+    if modules is None:
+        modules = CHECKED_MODULES
+    problems = []
+    for module in modules:
+        measured = measure_import(module)
+        heavy = sorted(set(measured["loaded"]).intersection(HEAVY_MODULES))
+        print(f"{module:<22} {measured['seconds']:8.3f}s   "
+              f"loaded {len(measured['loaded'])} modules")
+        if measured["error"] is not None:
+            problems.append(f"importing {module} raised {measured['error']}")
+        if measured["seconds"] > IMPORT_BUDGET_SECONDS:
+            problems.append(f"importing {module} took {measured['seconds']:.3f}s, "
+                            f"over the budget of {IMPORT_BUDGET_SECONDS}s")
+        if measured["calls"]:
+            calls = ", ".join(sorted(set(measured["calls"])))
+            problems.append(f"importing {module} called {calls}")
+        if heavy:
+            problems.append(f"importing {module} loaded {', '.join(heavy)}")
+    return problems
+
+if __name__ == "__main__":
+    found_problems = check_imports()
+    for problem in found_problems:
+        print("IMPORT PROBLEM:", problem)
+    if found_problems:
+        sys.exit(1)
+    print("All imports within budget")
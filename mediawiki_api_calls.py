@@ -7,23 +7,41 @@ to be revealing to absolutely everyone what I have written yet.
 """
 import os
 import re
-#from typing import Tuple, List
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from typing import TYPE_CHECKING
 #import json
-import requests
-# static variables that lead to where the source material is located at.
+# requests, pandas and secret_variables (the static variables that lead to where the source
+# material is located at) are imported by the functions that use them, so importing this
+# file stays fast and works offline
 #from bs4 import BeautifulSoup
-import pandas as pd
-import secret_variables
 import regex_cleaners
+import text_cache
+import page_files
+
+if TYPE_CHECKING:
+    import requests
 
-API_ENDPOINT = secret_variables.WIKI_URL + "/w/api.php"
 SCRAPED_FILES_PATH = "pages/"
 DATASETS_PATH = "datasets/"
 NOTES_PATH = "pages/notes/"
 NOTES_IDS_START = 999
-TIMEOUT_LIMIT = None
+TIMEOUT_LIMIT = (10, 120) # (connect, read) in seconds
 # I can afford to wait a minute to get past a connection crater
 # though I probably should not make the limit forever; maybe a big number like 120 seconds
+MAX_RETRIES = 5
+BACKOFF_BASE = 1 # seconds; doubled on every retry, then jittered
+BACKOFF_CAP = 60
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+POOL_SIZE = 16 # keep-alive connections held open to the wiki
+PAGEIDS_BATCH_LIMIT = 50 # the API accepts up to 50 "|"-joined page IDs per request
+REVIDS_BATCH_LIMIT = 50 # same limit for revision IDs
+LIST_LIMIT = "max" # lets the API pick the most our rights allow (500 for users, 5000 for bots)
+FETCH_CONCURRENCY = 8 # content requests in flight at once in fetch_revision_worddiffs()
+HOST_MIN_INTERVAL = 0.05 # seconds between the starts of two requests to the same host
 
 replace_keys_dict = {
     '/': '-',
@@ -32,6 +50,330 @@ replace_keys_dict = {
     '\"': '\''
 }
 
+_session = None
+_api_endpoint = None
+_stats_lock = threading.Lock()
+_host_lock = threading.Lock()
+_host_next_slot = {} # host -> earliest time.monotonic() the next request may start
+api_call_stats = {} # "action" -> calls, retries, failures, seconds, max seconds
+
+def get_api_endpoint() -> str:
+    """
+    Returns the api.php URL of the wiki, read from secret_variables on first use.
+    """
+    global _api_endpoint
+    if _api_endpoint is None:
+        import secret_variables
+        _api_endpoint = secret_variables.WIKI_URL + "/w/api.php"
+    return _api_endpoint
+
+def get_session() -> "requests.Session":
+    """
+    Returns the requests.Session shared by every API call in this file, creating it on first use.
+
+    The session keeps connections to the wiki alive between calls, so a long run over
+    thousands of revisions does not pay for a new TCP+TLS handshake on every request.
+    The user agent header (required by MediaWiki for script requests) is set once here.
+    """
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        import secret_variables
+        session = requests.Session()
+        session.headers.update({"User-Agent": secret_variables.USERAGENT})
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+def _record_call(action: str, seconds: float, retries: int, failed: bool = False):
+    """
+    Adds one finished API call to the api_call_stats counters.
+    """
+    with _stats_lock:
+        stats = api_call_stats.setdefault(action, {"calls": 0, "retries": 0, "failures": 0,
+                                                   "seconds": 0.0, "max seconds": 0.0})
+        stats["calls"] += 1
+        stats["retries"] += retries
+        stats["failures"] += int(failed)
+        stats["seconds"] += seconds
+        stats["max seconds"] = max(stats["max seconds"], seconds)
+
+def print_api_stats():
+    """
+    Prints call counts, retries and latencies per API action since the script started.
+    """
+    with _stats_lock:
+        for action, stats in sorted(api_call_stats.items()):
+            average = stats["seconds"] / stats["calls"] if stats["calls"] else 0
+            print(f"{action}: {stats['calls']} calls, {stats['retries']} retries, "
+                  f"{stats['failures']} failures, avg {average:.3f}s, "
+                  f"max {stats['max seconds']:.3f}s")
+
+def _wait_for_host(url: str):
+    """
+    Blocks until HOST_MIN_INTERVAL has passed since the last request to the host of the
+    given URL was allowed to start. Keeps concurrent fetching polite to the wiki.
+    """
+    host = urlparse(url).netloc
+    with _host_lock:
+        now = time.monotonic()
+        slot = max(now, _host_next_slot.get(host, now))
+        _host_next_slot[host] = slot + HOST_MIN_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
+def api_get(params: dict, api_endpoint: str = None) -> dict:
+    """
+    Sends one GET request to the MediaWiki API and returns the decoded JSON.
+
+    Every function in this file goes through here. Connection errors (such as the DNS
+    failures noted in datasets_creation.py), timeouts, server-side errors and empty response
+    bodies (the "expecting value: line 1 column 1" JSONDecodeError) are retried up to
+    MAX_RETRIES times with jittered exponential backoff before giving up.
+
+    ## Parameters
+    params: the query parameters for the API call.    
+    api_endpoint: default the wiki's (see get_api_endpoint()); the api.php URL to call.
+    ## Returns
+    the JSON response as a dict.
+    """
+    import requests
+    if api_endpoint is None:
+        api_endpoint = get_api_endpoint()
+    action = params.get("action", "unknown")
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            _wait_for_host(api_endpoint)
+            response = get_session().get(url=api_endpoint, params=params, timeout=TIMEOUT_LIMIT)
+            if response.status_code in RETRY_STATUS_CODES:
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code}",
+                                                    response=response)
+            data = response.json()
+        # requests' JSONDecodeError is a ValueError; raised when the body comes back empty
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.HTTPError, ValueError) as error:
+            if attempt == MAX_RETRIES:
+                _record_call(action, time.perf_counter() - start, attempt, failed=True)
+                raise
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            print(f"API call ({action}) failed with {type(error).__name__}; "
+                  f"retrying in {delay:.1f}s")
+            time.sleep(delay)
+        else:
+            _record_call(action, time.perf_counter() - start, attempt)
+            return data
+
+def iter_api_continue(params: dict, api_endpoint: str = None):
+    """
+    Yields every response of an API query, following the "continue" block of each
+    response until the API reports that the result is complete.
+
+    Without this, anything past the first batch of a result (e.g. the categories of pages
+    past the first cllimit categories) is silently dropped.
+
+    ## Parameters
+    params: the query parameters for the first API call.    
+    api_endpoint: default the wiki's (see get_api_endpoint()); the api.php URL to call.
+    ## Returns
+    a generator of JSON responses, one per request made.
+    """
+    request = dict(params)
+    while True:
+        data = api_get(request, api_endpoint=api_endpoint)
+        yield data
+        if "continue" not in data:
+            return
+        request = dict(params)
+        request.update(data["continue"])
+
+def merge_query_pages(responses) -> dict[int, dict]:
+    """
+    Merges the "pages" of a number of continued query responses into one dict per page.
+
+    A continued query can return a page several times, each time with another part of
+    its data (e.g. its categories split over two responses). List values are concatenated
+    and other values are overwritten.
+
+    ## Parameters
+    responses: an iterable of query JSON responses, such as from iter_api_continue().
+    ## Returns
+    a dict of page ID -> merged page JSON object.
+    """
+    pages = {}
+    for data in responses:
+        for page in data.get("query", {}).get("pages", {}).values():
+            if "pageid" not in page: # missing or invalid page
+                continue
+            merged = pages.setdefault(page["pageid"], {})
+            for key, value in page.items():
+                if isinstance(value, list):
+                    merged.setdefault(key, []).extend(value)
+                else:
+                    merged[key] = value
+    return pages
+
+def page_metadata(page: dict) -> dict:
+    """
+    Pulls the fields used by the datasets out of a merged page JSON object
+    (see merge_query_pages()).
+
+    ## Parameters
+    page: a page JSON object queried with prop=info|categories|revisions.
+    ## Returns
+    a dict containing:    
+    - title    
+    - categories: the page's categories other than the main hidden one, without the
+    "Category:" prefix    
+    - lastedit: timestamp of the latest revision    
+    - lastrevid: ID of the latest revision    
+    - length: page size in bytes
+    """
+    # All categories take the form "Category:catname"; bypass junk, drop the useless prefix
+    categories = [cat["title"][9:] for cat in page.get("categories", [])[1:]]
+    revisions = page.get("revisions", [{}])
+    return {
+        "title": page["title"],
+        "categories": categories,
+        "lastedit": revisions[0].get("timestamp"),
+        "lastrevid": page.get("lastrevid", revisions[0].get("revid")),
+        "length": page.get("length", revisions[0].get("size")),
+    }
+
+def get_pages_metadata(pageids: list[int]) -> dict[int, dict]:
+    """
+    Gets the title, categories, last edit time, latest revision and size of many pages
+    in batches of PAGEIDS_BATCH_LIMIT pages per request, instead of 3-4 requests per page.
+
+    ## Parameters
+    pageids: a list of page IDs.
+    ## Returns
+    a dict of page ID -> metadata dict (see page_metadata()).
+    """
+    metadata = {}
+    for start in range(0, len(pageids), PAGEIDS_BATCH_LIMIT):
+        batch = pageids[start:start + PAGEIDS_BATCH_LIMIT]
+        params = {
+            "action": "query",
+            "format": "json",
+            "pageids": "|".join(str(pageid) for pageid in batch),
+            "prop": "info|categories|revisions",
+            "clshow": "!hidden",
+            "cllimit": "max", # cllimit is shared by every page in the request, not per page
+            "rvprop": "ids|timestamp|size", # latest revision only when querying many pages
+        }
+        pages = merge_query_pages(iter_api_continue(params))
+        for pageid, page in pages.items():
+            metadata[pageid] = page_metadata(page)
+        print(f"API called metadata for {len(batch)} pages")
+    return metadata
+
+def iter_category_members(category: str, api_endpoint: str = None):
+    """
+    Yields every page in a given category, following continuation so categories with more
+    pages than one response can hold are not cut short.
+
+    ## Parameters
+    category: a MediaWiki category to search through.    
+    api_endpoint: default the wiki's (see get_api_endpoint()); the api.php URL to call.
+    ## Returns
+    a generator of {pageid: int, ns: int, title: pagename} dicts.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "list": "categorymembers",
+        "cmtitle": category,
+        "cmlimit": LIST_LIMIT,
+    }
+    for data in iter_api_continue(params, api_endpoint=api_endpoint):
+        yield from data["query"]["categorymembers"]
+
+def iter_revision_history(pageid: int, rvprop: str = "ids|timestamp|flags|comment|user",
+                          rvdir: str = "older", rvstartid: int = None):
+    """
+    Yields every revision of a given page, following continuation so pages with a long
+    history are not cut short.
+
+    ## Parameters
+    pageid: an ID.    
+    rvprop: default "ids|timestamp|flags|comment|user"; the revision properties to get.    
+    rvdir: default "older" (newest first); "newer" walks the history oldest first.    
+    rvstartid: default None; a revision ID to start the walk at (included).
+    ## Returns
+    a generator of raw revision JSON objects.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "pageids": f"{pageid}",
+        "prop": "revisions",
+        "rvprop": rvprop,
+        "rvdir": rvdir,
+        "rvlimit": LIST_LIMIT,
+    }
+    if "content" in rvprop:
+        params["rvslots"] = "main"
+    if rvstartid is not None:
+        params["rvstartid"] = rvstartid
+    for data in iter_api_continue(params):
+        yield from data["query"]["pages"][str(pageid)].get("revisions", [])
+
+def iter_user_contribs(username: str, ucend: str = None,
+                       ucprop: str = "ids|title|timestamp|comment|size|flags"):
+    """
+    Yields every contribution made by a given user, newest first, following continuation.
+
+    ## Parameters
+    username: a MediaWiki username.    
+    ucend: default None; an ISO timestamp (2025-05-25T21:34:07Z) to stop at.    
+    ucprop: default "ids|title|timestamp|comment|size|flags"; the properties to get.
+    ## Returns
+    a generator of raw usercontribs JSON objects.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "list": "usercontribs",
+        "ucuser": username,
+        "ucprop": ucprop,
+        "uclimit": LIST_LIMIT,
+    }
+    if ucend is not None:
+        params["ucend"] = ucend
+    for data in iter_api_continue(params):
+        yield from data["query"]["usercontribs"]
+
+def get_category_snapshot(category: str = None) -> dict[int, dict]:
+    """
+    Gets the title, categories, last edit time, latest revision and size of every page in
+    a category with one continued query (generator=categorymembers plus
+    prop=info|categories|revisions), instead of a listing followed by calls per page.
+
+    ## Parameters
+    category: default the main category; a MediaWiki category to snapshot.
+    ## Returns
+    a dict of page ID -> metadata dict (see page_metadata()).
+    """
+    import secret_variables
+    params = {
+        "action": "query",
+        "format": "json",
+        "generator": "categorymembers",
+        "gcmtitle": category or secret_variables.MAIN_CATEGORY,
+        "gcmlimit": LIST_LIMIT,
+        "prop": "info|categories|revisions",
+        "clshow": "!hidden",
+        "cllimit": "max",
+        "rvprop": "ids|timestamp|size",
+    }
+    pages = merge_query_pages(iter_api_continue(params))
+    print(f"API called a snapshot of {len(pages)} pages in {params['gcmtitle']}")
+    return {pageid: page_metadata(page) for pageid, page in pages.items()}
+
 def get_pages_by_category(api_endpoint: str, category: str):
     """
     Fetch all pages based on a given category.
@@ -55,43 +397,45 @@ def get_pages_by_category(api_endpoint: str, category: str):
         }    
     }
     """
-    params = {
-        "action": "query",
-        "format": "json",
-        "list": "categorymembers",
-        "cmtitle": category,
-        "cmlimit": 100 # number to be increased in the future if I get that many files
-    }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=api_endpoint, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    print(response)
-    data = response.json()
-    return data
+    members = list(iter_category_members(category, api_endpoint=api_endpoint))
+    return {"batchcomplete": "", "query": {"categorymembers": members}}
 
-def scrape_one_page_new(pageid: int, pagename: str, handle_discussions=False):
+def scrape_one_page_new(pageid: int, pagename: str, handle_discussions=False,
+                        lastrevid: int = None, previous: dict = None) -> dict:
     """
     API queries a MediaWiki page. Both its formatted and raw forms will be saved.
+    Files are written atomically, so an interrupted scrape never leaves half a page behind.
 
     ## Parameters:
     pagelink: a URL to a given MediaWiki page.    
     pagename: path + name for the local .txt file.    
     highlight_sections: default False; marks topic sections in the category discussions\
-    page by separating them with a special character that does not appear in main text bodies.
+    page by separating them with a special character that does not appear in main text bodies.    
+    lastrevid: default None; the page's latest revision ID, if known, so an unchanged
+    page's wikitext can come from the text_cache.    
+    previous: default None; the page's scrape manifest entry from the last cycle. If the
+    new revision has the same wikitext (a null edit or a revert) and the files are still
+    there under the same names, nothing is cleaned or rewritten.
     ## Returns
-    Not returned but rather generated: two .txt file at the indicated path with the indicated
-    names, denoted as "wikitext" or "raw".
+    Generated: two .txt file at the indicated path with the indicated
+    names, denoted as "wikitext" or "raw".    
+    Returned: {hash, files}: a hash of the page's wikitext and the paths of every file
+    written, for the scrape manifest (see page_files.py).
     """
     print(f"Getting wikitext for pageid {pageid}")
-    wikitext = get_wikitext_current(pageid)
+    wikitext = get_wikitext_current(pageid, lastrevid)
+    files = [pagename+"-"+f"{pageid}W"+".txt", pagename+"-"+f"{pageid}R"+".txt"]
+    wikitext_hash = page_files.text_hash(wikitext)
+    if (previous and previous.get("hash") == wikitext_hash and previous["files"][:2] == files
+            and all(os.path.exists(path) for path in previous["files"])):
+        # same text, so the same files (notes included); untouched files also keep the
+        # pipeline from seeing pages/ as changed. reclean.py covers cleaner changes.
+        print(f"Wikitext for pageid {pageid} is unchanged, kept its files")
+        return {"hash": wikitext_hash, "files": previous["files"]}
 
-    with open(pagename+"-"+f"{pageid}W"+".txt", 'w', encoding='utf-8') as f:
-        f.write(wikitext)
+    page_files.write_text_atomic(files[0], wikitext)
     rawtext = regex_cleaners.deformat_cycle(wikitext)
-    with open(pagename+"-"+f"{pageid}R"+".txt", 'w', encoding='utf-8') as f:
-        f.write(rawtext)
+    page_files.write_text_atomic(files[1], rawtext)
     print(f"Wrote page to {pagename}-{pageid}R/W.txt")
 
     if handle_discussions: # the discussion page calls for special procedures
@@ -105,14 +449,14 @@ def scrape_one_page_new(pageid: int, pagename: str, handle_discussions=False):
                 for replace_key, replacement in replace_keys_dict.items():
                     header = header.replace(replace_key, replacement)
                 header = header.replace("  ", " ")
-                with open(NOTES_PATH+header+f"-NOTES-{topics_counter:04}W.txt",
-                        'w', encoding='utf-8') as n:
-                    n.write(topic) # this is for the raw wikitext
-                with open(NOTES_PATH+header+f"-NOTES-{topics_counter:04}R.txt",
-                        'w', encoding='utf-8') as n:
-                    n.write(regex_cleaners.deformat_cycle(topic)) # rawtext
+                notes_w = NOTES_PATH+header+f"-NOTES-{topics_counter:04}W.txt"
+                notes_r = NOTES_PATH+header+f"-NOTES-{topics_counter:04}R.txt"
+                page_files.write_text_atomic(notes_w, topic) # this is for the raw wikitext
+                page_files.write_text_atomic(notes_r, regex_cleaners.deformat_cycle(topic))
+                files += [notes_w, notes_r]
                 print(f"Wrote notes to {NOTES_PATH+header}-NOTES-{topics_counter:04}R/W.txt")
             topics_counter+=1
+    return {"hash": wikitext_hash, "files": files}
 
 def purge_folders(path, recursive=False):
     """
@@ -137,7 +481,7 @@ def purge_folders(path, recursive=False):
         elif recursive and os.path.isdir(filepath):
             purge_folders(filepath)
 
-def scrapecycle():
+def scrapecycle(incremental=False, metadata: dict = None):
     """
     Carries out a "web scrape cycle".
     - Delete existing .txt files
@@ -147,30 +491,72 @@ def scrapecycle():
     - Run a special set of instructions to scrape then parse a long discussions page that
     requires its own procedure.
 
+    In incremental mode nothing is purged. The scrape manifest (see page_files.py) records
+    the latest revision written for every page; only pages whose latest revision moved
+    since then are fetched and rewritten, and only the files of pages that left the
+    category (or of discussion topics that were removed) are deleted.
+
     ## Parameters
-    None.
+    incremental: default False; only refresh the pages that changed since the last cycle.    
+    metadata: default None; page ID -> metadata of the category pages, the userpage and the
+    discussion page, when the caller already has a snapshot of them (see
+    datasets_creation._category_snapshot()). Asked from the API otherwise.
     ## Returns
     A number of .txt files in the /notes folder, which is also kept hidden for now.
     Text files names take the format pagename-pageid.txt, with pageid taking up 4 chars.
     """
-    purge_folders(SCRAPED_FILES_PATH, recursive=True)
-    main_cat_json = get_pages_by_category(API_ENDPOINT, secret_variables.MAIN_CATEGORY)
-    #print(main_cat_json)
-    for page in main_cat_json["query"]["categorymembers"]:
+    import secret_variables
+    if incremental:
+        manifest = page_files.load_manifest()
+    else:
+        purge_folders(SCRAPED_FILES_PATH, recursive=True)
+        manifest = {}
+    special_ids = [secret_variables.USERPAGE_ID, secret_variables.DISCUSSION_ID]
+    if metadata is None:
+        # one snapshot gives every page's title and latest revision ID
+        metadata = get_category_snapshot()
+        metadata.update(get_pages_metadata(special_ids))
+    targets = []
+    for pageid, page in sorted(metadata.items()):
+        if pageid in special_ids:
+            continue # added below, the discussion page gets its own handling
         #print(f"id: {page['pageid']}; title: {page['title']}")
         #pagelink = secret_variables.WIKI_URL + "/wiki/" + page['title'].replace(' ', '_')
         pagename = page["title"]
-        pageid = page["pageid"]
         for replace_key, replacement in replace_keys_dict.items():
             #print(replace_key)
             #if replace_key in pagename:
             pagename = pagename.replace(replace_key, replacement)
-        scrape_one_page_new(pageid, SCRAPED_FILES_PATH+pagename)
+        targets.append((pageid, SCRAPED_FILES_PATH+pagename, False))
     #print("scraping the talk page")
-    scrape_one_page_new(secret_variables.USERPAGE_ID, SCRAPED_FILES_PATH+"Userpage")
-    scrape_one_page_new(secret_variables.DISCUSSION_ID,
-                        SCRAPED_FILES_PATH+secret_variables.CAT_TALK_FILENAME,
-                        handle_discussions=True)
+    targets.append((secret_variables.USERPAGE_ID, SCRAPED_FILES_PATH+"Userpage", False))
+    targets.append((secret_variables.DISCUSSION_ID,
+                    SCRAPED_FILES_PATH+secret_variables.CAT_TALK_FILENAME, True))
+
+    new_manifest = {}
+    rewritten = 0
+    for pageid, pagename, handle_discussions in targets:
+        lastrevid = metadata[pageid]["lastrevid"]
+        entry = manifest.get(str(pageid))
+        if (entry and entry["lastrevid"] == lastrevid
+                and all(os.path.exists(path) for path in entry["files"])):
+            new_manifest[str(pageid)] = entry # unchanged since the last cycle
+            continue
+        written = scrape_one_page_new(pageid, pagename, handle_discussions, lastrevid,
+                                      previous=entry)
+        if not entry or written["hash"] != entry.get("hash"):
+            rewritten += 1
+        if entry: # renamed pages and removed discussion topics leave old files behind
+            page_files.remove_files([path for path in entry["files"]
+                                     if path not in written["files"]])
+        new_manifest[str(pageid)] = dict(written, title=metadata[pageid]["title"],
+                                         lastrevid=lastrevid)
+    for pageid, entry in manifest.items():
+        if pageid not in new_manifest: # the page left the category
+            page_files.remove_files(entry["files"])
+    page_files.save_manifest(new_manifest)
+    page_files.refresh_file_index()
+    print(f"Scrape cycle done; rewrote {rewritten} of {len(new_manifest)} pages")
     # scrape_one_page(secret_variables.DISCUSSION_PAGE,
     #                 SCRAPED_FILES_PATH+secret_variables.CAT_TALK_FILENAME,
     #                 highlight_sections=True)
@@ -186,21 +572,8 @@ def getallpageids() -> list[int]:
     ## Returns
     a list of page IDs.
     """
-    params = {
-            "action": "query",
-            "format": "json",
-            "list": "categorymembers",
-            "cmtitle": secret_variables.MAIN_CATEGORY,
-            "cmlimit": 100 # number to be increased in the future if I get that many files
-        }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    #print(response)
-    data = response.json()
-    pageids = [x["pageid"] for x in data["query"]["categorymembers"]]
+    import secret_variables
+    pageids = [x["pageid"] for x in iter_category_members(secret_variables.MAIN_CATEGORY)]
     #print(len(pageids))
     #print(pageids)
     print("Added the discussion and userpage ids to the return")
@@ -213,79 +586,46 @@ def get_categories(pageid: int):
     """
     Returns the category of a given page.
 
-    I previously attempted to use a generator to pull all pages of a given category to pass
-    to the api to get all of their other categories, but it straight up returned nothing.
-    I also tried feeding more than 5 pages at once but pages past the 5th or so return
-    incorrect data; with pages that clearly have categories claiming to have none.
-    I don't know how to fix this so I will leave this as a per-page call to be used
-    in a pandas apply() function.
+    I previously tried feeding more than 5 pages at once but pages past the 5th or so
+    returned incorrect data; with pages that clearly have categories claiming to have none.
+    That was cllimit (5) being shared by every page in the request, with the rest of the
+    categories waiting behind a "continue" I never followed. get_pages_metadata() follows
+    it and handles many pages at once; this is kept for one-off lookups.
 
     ## Parameters
     pageid: an ID.
     ## Returns
     A list of categories other than the main hidden category, or [] if no others exist.
     """
-    # I have no idea what the upper limit for pages accepted into pageids is
-    # so doing it manually
-    params = {
-        "action": "query",
-        "format": "json",
-        "prop": "categories",
-        "pageids": pageid, # the api does not accept Python lists; needs a bit of engineering
-        "cllimit": 5,
-        "clshow": "!hidden",
-        #"rvlimit": 100, #
-    }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    #print(response)
-    data = response.json()
-    # print(pageids)
-    #print(json.dumps(data, indent=2))
-    pagedata = data["query"]["pages"][str(pageid)]
     print(f"API called category data for page {pageid}")
-    if "categories" in pagedata: # some pages, like my user page, have no categories.
-        cats = data["query"]["pages"][str(pageid)]["categories"][1:] # bypass junk, get to categories
-
-        # All categories take the form "Category:catname"
-        # Drop the useless prefix
-        return [cat["title"][9:] for cat in cats]
-    return []
+    # some pages, like my user page, have no categories.
+    return get_pages_metadata([pageid])[pageid]["categories"]
 
 # for pageid in pageids:
 #     get_categories(pageid)
 # print(get_categories(567))
 
 # get detailed data on each page, including revisions.
-def get_recent_revisions():
+def get_recent_revisions(latest_date=None):
     """
     Get my most recent revisions between the most recent pipelined edits and the time of running this script.
     This lets me soft-update the datasets without rebuilding everything.
+
+    ## Parameters
+    latest_date: default None; the timestamp of the most recent pipelined edit, as stored
+    in the datasets (see revision_store.latest_timestamp()). Read from revisions_df.csv if
+    not given.
     """
-    revs_df = pd.read_csv("datasets/revisions_df.csv")
-    latest_date = pd.to_datetime(revs_df["Timestamp"]).max()
-    latest_date = latest_date.replace(" ", "T") + "Z"
+    import pandas as pd
+    import secret_variables
+    if latest_date is None:
+        revs_df = pd.read_csv("datasets/revisions_df.csv")
+        latest_date = pd.to_datetime(revs_df["Timestamp"]).max()
+    # stored timestamps are shifted to EST; shift back to the API's UTC
+    latest_date = pd.Timestamp(latest_date) + pd.Timedelta(hours=5)
+    latest_date = latest_date.strftime("%Y-%m-%dT%H:%M:%SZ")
     # 2025-05-25 21:34:07 -> 2025-05-25T21:34:07Z to match MediaWiki timestamp formats
-    params = {
-        "action": "query",
-        "format": "json",
-        "list": "usercontribs",
-        "ucuser": secret_variables.USERNAME,
-        #"prop": "revisions",
-        #"rvprop": "ids|timestamp|flags|comment|user",
-        "ucend": latest_date,
-        "uclimit": 100,
-    }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
-    return data["query"]["usercontribs"]
+    return list(iter_user_contribs(secret_variables.USERNAME, ucend=latest_date))
 
 def get_revision_history(pageid: int):
     """
@@ -301,26 +641,8 @@ def get_revision_history(pageid: int):
     a list of dictionaries each containing a revision ID, timestamp, and comment.
     Revision sizes will be calculated in another function.
     """
-    params = {
-        "action": "query",
-        "format": "json",
-        "pageids": f"{pageid}",
-        "prop": "revisions",
-        "rvprop": "ids|timestamp|flags|comment|user",
-        "rvlimit": 100,
-        #"cmtitle": secret_variables.MAIN_CATEGORY,
-        #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
-    }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
-    #print(json.dumps(data, indent=2))
-    revisions = data["query"]["pages"][str(pageid)]["revisions"]
     output = []
-    for revision in revisions:
+    for revision in iter_revision_history(pageid):
         output.append(dict((key, revision[key])
                            for key in ["revid", "timestamp", "comment"]))
         output[-1]["minor"] = "minor" in revision
@@ -353,12 +675,7 @@ def get_revision_deets(revid: int):
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
+    data = api_get(params)
     #print(json.dumps(data, indent=2))
     print(f"Returning full comparison details for revision with id {revid}")
     return data["compare"]
@@ -394,12 +711,7 @@ def get_pageinfo(pageid: int):
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
+    data = api_get(params)
     #print(json.dumps(data, indent=2))
     print(f"Returning full info for page {pageid}")
     return data["query"]["pages"][str(pageid)]
@@ -431,12 +743,7 @@ def get_pagesize(pageid: int):
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
+    data = api_get(params)
     #print(json.dumps(data, indent=2))
     print(f"Returning page size for page {pageid}")
     return data["query"]["pages"][str(pageid)]["revisions"][0]["size"]
@@ -444,6 +751,8 @@ def get_pagesize(pageid: int):
 def get_wikitext(revid: int) -> str:
     """
     Returns the formatted wikitext for a given page at a given revision ID.
+    A revision never changes, so each one is only downloaded once and then read from
+    the on-disk text_cache.
 
     ## Parameters
     revid: a revision ID
@@ -452,6 +761,9 @@ def get_wikitext(revid: int) -> str:
     """
     if revid == 0:
         return ""
+    wikitext = text_cache.cache_get("wikitext", revid)
+    if wikitext is not None:
+        return wikitext
     params = {
         "action": "parse",
         "format": "json",
@@ -462,39 +774,95 @@ def get_wikitext(revid: int) -> str:
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
+    data = api_get(params)
+    wikitext = data["parse"]["wikitext"]["*"]
+    text_cache.cache_put("wikitext", revid, wikitext)
+    return wikitext
+
+def iter_revisions_content(revids: list[int]):
+    """
+    Yields the wikitext of many revisions, fetching up to REVIDS_BATCH_LIMIT revisions per
+    request (prop=revisions&revids=a|b|c) instead of one action=parse call per revision.
+
+    Revisions already in the text_cache are yielded from it without a request, and the
+    rest are stored in it as they arrive. When a batch is too large for one response the
+    API returns part of it plus a "continue", which is followed.
+
+    ## Parameters
+    revids: a list of revision IDs.
+    ## Returns
+    a generator of (revid, wikitext) tuples, not necessarily in the order of revids.
+    Revisions whose text is hidden or missing are skipped; 0 (no revision) is ignored.
+    """
+    missing = []
+    for revid in dict.fromkeys(revids): # drop duplicates, keep order
+        if revid == 0:
+            continue
+        wikitext = text_cache.cache_get("wikitext", revid)
+        if wikitext is None:
+            missing.append(revid)
+        else:
+            yield revid, wikitext
+    for start in range(0, len(missing), REVIDS_BATCH_LIMIT):
+        yield from _fetch_revisions_batch(missing[start:start + REVIDS_BATCH_LIMIT])
+
+def _fetch_revisions_batch(batch: list[int]) -> list[tuple[int, str]]:
+    """
+    Downloads the wikitext of up to REVIDS_BATCH_LIMIT revisions in one request (following
+    any "continue") and stores each one in the text_cache.
+
+    ## Returns
+    a list of (revid, wikitext) tuples, see iter_revisions_content().
+    """
+    contents = []
+    params = {
+        "action": "query",
+        "format": "json",
+        "revids": "|".join(str(revid) for revid in batch),
+        "prop": "revisions",
+        "rvprop": "ids|content",
+        "rvslots": "main",
     }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
-    return data["parse"]["wikitext"]["*"]
+    for data in iter_api_continue(params):
+        for page in data["query"].get("pages", {}).values():
+            for revision in page.get("revisions", []):
+                slot = revision.get("slots", {}).get("main", {})
+                if "*" not in slot: # hidden (deleted) revision text
+                    continue
+                text_cache.cache_put("wikitext", revision["revid"], slot["*"])
+                contents.append((revision["revid"], slot["*"]))
+    print(f"API called content for {len(batch)} revisions")
+    return contents
 
-def get_wikitext_current(pageid: int) -> str:
+def get_wikitext_current(pageid: int, lastrevid: int = None) -> str:
     """
     get_wikitext except it gets the latest for a given page.
+
+    The latest revision is stored in the text_cache like any other. If the caller already
+    knows the page's latest revision ID (e.g. from get_pages_metadata()), pass it as
+    lastrevid and an unchanged page is read from the cache instead of downloaded.
     """
+    if lastrevid is not None:
+        wikitext = text_cache.cache_get("wikitext", lastrevid)
+        if wikitext is not None:
+            return wikitext
     params = {
         "action": "parse",
         "format": "json",
         "pageid": f"{pageid}",
-        "prop": "wikitext",
+        "prop": "wikitext|revid",
         #"rvprop": "size",
         #"rvlimit": 100,
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-
     # I encountered a bug where the response.json() line failed for some reason
     # jsondecodeerror: expecting value line 1 column 1 (char 0)
-    # so here I am trying to catch the response if or when it happens again
-    data = response.json()
-    return data["parse"]["wikitext"]["*"]
+    # api_get() now retries when that happens instead of crashing the whole run
+    data = api_get(params)
+    wikitext = data["parse"]["wikitext"]["*"]
+    text_cache.cache_put("wikitext", data["parse"]["revid"], wikitext)
+    return wikitext
 
 def get_wordcount_file(filename: str):
     """
@@ -508,11 +876,16 @@ def get_wordcount_text(text: str):
     """
     return len(text.strip().split(" "))
 
-def get_revision_wordcount(revid: int):
+def get_revision_wordcount(revid: int, parentid: int = None):
     """
     Given a revision ID, compares the file at that revision to the previous version.
     Returns length difference (current - prev) measured by words.
+
+    If the previous revision ID is already known (it is in every revision listing as
+    parentid), pass it to skip the compare call that looks it up.
     """
+    if parentid is not None:
+        return get_wordcount_diff(get_wikitext(revid), get_wikitext(parentid))
     params = {
         "action": "compare",
         "format": "json",
@@ -524,29 +897,138 @@ def get_revision_wordcount(revid: int):
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    deets = response.json()
+    deets = api_get(params)
     old_rev_id = deets["compare"]["fromrevid"] if "fromrevid" in deets["compare"] else 0
 
     # Extract wikitext for provided revision ID, then clean text and count words.
     rev_wikitext = get_wikitext(revid)
     old_rev_wikitext = get_wikitext(old_rev_id)
+    return get_wordcount_diff(rev_wikitext, old_rev_wikitext)
+
+def get_wordcount_diff(rev_wikitext: str, old_rev_wikitext: str) -> int:
+    """
+    Deformats two versions of a page and returns their length difference (current - prev)
+    measured by words.
+    """
     rev_raw = regex_cleaners.deformat_cycle(rev_wikitext)
     old_rev_raw = regex_cleaners.deformat_cycle(old_rev_wikitext)
 
     curr_words = get_wordcount_text(rev_raw)
     old_words = get_wordcount_text(old_rev_raw)
-    #print(revid, old_rev_id)
     #print(curr_words, old_words)
     worddiff = curr_words - old_words
     #bytediff = len(rev_wikitext) - len(old_rev_wikitext)
     return worddiff
     # insert deformatting functions here
 
+def revision_metadata(pageid: int, revision: dict) -> dict:
+    """
+    Pulls the fields used by the revisions dataset out of a raw revision JSON object
+    queried with rvprop=ids|timestamp|flags|size.
+
+    ## Parameters
+    pageid: the ID of the page the revision belongs to.    
+    revision: a raw revision JSON object.
+    ## Returns
+    a dict containing revid, parentid (0 for a page's first revision), pageid, timestamp,
+    minor and size.
+    """
+    return {
+        "revid": revision["revid"],
+        "parentid": revision.get("parentid", 0),
+        "pageid": pageid,
+        "timestamp": revision["timestamp"],
+        "minor": "minor" in revision,
+        "size": revision["size"],
+    }
+
+def get_revisions_metadata(pageids: list[int]) -> list[dict]:
+    """
+    Gets the timestamp, minor flag, size and parent of every revision of the given pages
+    from the history listing (up to LIST_LIMIT revisions per request, no content).
+    Byte changes are computed from the sizes locally instead of with a compare call per
+    revision (see pandas_df_funcs.revisions_frame()).
+
+    ## Parameters
+    pageids: a list of page IDs.
+    ## Returns
+    a list of dicts (see revision_metadata()), each page's revisions newest first.
+    """
+    revisions = []
+    for pageid in pageids:
+        revisions += [revision_metadata(pageid, revision) for revision
+                      in iter_revision_history(pageid, rvprop="ids|timestamp|flags|size")]
+        print(f"Acquired revision metadata for page with ID {pageid}")
+    return revisions
+
+def walk_page_revisions(pageid: int, after_revid: int = None, prev_words: int = None):
+    """
+    Walks the full history of a page oldest to newest and yields the metadata and word
+    count change of every revision.
+
+    The revisions and their content are pulled in bulk (prop=revisions&rvprop=content)
+    instead of one compare and two parse calls per revision, and each revision's text is
+    deformatted and word counted exactly once: it serves as the "current" text for its own
+    revision and as the "previous" text for the next one. The downloaded wikitext is also
+    stored in the text_cache for get_wikitext().
+
+    ## Parameters
+    pageid: an ID.    
+    after_revid: default None; resume the walk after this revision (see revisions_journal.py)
+    instead of starting at the first one.    
+    prev_words: the word count of the after_revid revision, needed with after_revid.
+    ## Returns
+    a generator of dicts, oldest revision first, each containing revid, parentid, pageid,
+    timestamp, minor, size, words and worddiff. The first revision of a page is compared
+    against an empty page, as in get_revision_wordcount(). Byte changes are computed from
+    the sizes afterwards (see pandas_df_funcs.revisions_frame()).
+    """
+    if after_revid is None:
+        # an empty page still counts as one word in get_wordcount_text()
+        prev_words = get_wordcount_text(regex_cleaners.deformat_cycle(""))
+    for revision in iter_revision_history(pageid, rvprop="ids|timestamp|flags|size|content",
+                                          rvdir="newer", rvstartid=after_revid):
+        if revision["revid"] == after_revid:
+            continue # already walked; rvstartid includes the revision it starts at
+        slot = revision.get("slots", {}).get("main", {})
+        wikitext = slot.get("*", "") # hidden (deleted) revision text comes back without "*"
+        if "*" in slot:
+            text_cache.cache_put("wikitext", revision["revid"], wikitext)
+        words = get_wordcount_text(regex_cleaners.deformat_cycle(wikitext))
+        yield dict(revision_metadata(pageid, revision), words=words, worddiff=words - prev_words)
+        prev_words = words
+    print(f"Walked revision history for page with ID {pageid}")
+
+def fetch_revision_worddiffs(revids: list[int], parentids: list[int],
+                             concurrency: int = FETCH_CONCURRENCY) -> list[int]:
+    """
+    Gets the word difference (see get_revision_wordcount()) of many revisions, downloading
+    their texts concurrently instead of one request after another.
+
+    The texts not yet in the text_cache are requested REVIDS_BATCH_LIMIT at a time, with up
+    to `concurrency` of those requests in flight at once. They share the pooled session and
+    still go through api_get(), so they are retried on failure and started HOST_MIN_INTERVAL
+    apart per host. The word counts are then worked out from the cache one revision after
+    another; cleaning is pure Python, so threads would not speed it up.
+
+    ## Parameters
+    revids: a list of revision IDs.    
+    parentids: the previous revision ID of each revision, from the revision listing
+    (0 for a page's first revision).    
+    concurrency: default FETCH_CONCURRENCY; how many content requests to run at once.
+    ## Returns
+    a list of word differences in the same order as revids.
+    """
+    missing = [revid for revid in dict.fromkeys(list(revids) + list(parentids))
+               if revid != 0 and not text_cache.cache_contains("wikitext", revid)]
+    batches = [missing[start:start + REVIDS_BATCH_LIMIT]
+               for start in range(0, len(missing), REVIDS_BATCH_LIMIT)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in executor.map(_fetch_revisions_batch, batches):
+            pass
+    return [get_revision_wordcount(revid, parentid)
+            for revid, parentid in zip(revids, parentids)]
+
 def get_page_lastedit(pageid: int) -> str:
     """
     See function title.
@@ -561,12 +1043,7 @@ def get_page_lastedit(pageid: int) -> str:
         #"cmtitle": secret_variables.MAIN_CATEGORY,
         #"cmlimit": 100 # doesn't work with revisions; only 1 page at a time
     }
-    headers = {
-        "User-Agent": secret_variables.USERAGENT
-        # Wikipedia requires a user agent string for Python script requests
-    }
-    response = requests.get(url=API_ENDPOINT, params=params, headers=headers, timeout=TIMEOUT_LIMIT)
-    data = response.json()
+    data = api_get(params)
     ts = data["query"]["pages"][f"{pageid}"]["revisions"][0]["timestamp"]
     return ts
 
@@ -0,0 +1,155 @@
+"""
+Contains functions for keeping track of the scraped page text files in pages/ and
+pages/notes/, so that a scrape cycle only rewrites the pages that changed.
+
+The manifest is a JSON file mapping each scraped page ID to the latest revision ID that
+was written to disk, a hash of its wikitext, and the files written for it. A page whose
+latest revision moved but whose wikitext hash did not (a null edit or a revert) keeps its
+files as they are, see mediawiki_api_calls.scrape_one_page_new().
+
+The file index maps each page or notes ID to its W and R files, built from one scan of
+each folder instead of searching the whole file list for every ID.
+"""
+import os
+import re
+import json
+import hashlib
+
+SCRAPED_FILES_PATH = "pages/"
+NOTES_PATH = "pages/notes/"
+MANIFEST_PATH = "pages_manifest.json" # kept outside pages/ so it is not mistaken for a page
+# pagename-1234W.txt, or header-NOTES-1234R.txt for discussion notes
+PAGE_FILENAME_PATTERN = re.compile(r"^(.*?)-(NOTES-)?(\d+)([WR])\.txt$")
+
+_file_index = {} # folder -> {ID -> {"name", "W", "R"}}, see file_index()
+
+def write_text_atomic(path: str, text: str):
+    """
+    Writes a text file so that readers only ever see the old or the new contents,
+    never a half-written file: the text goes to a temporary file next to the
+    destination, which then replaces it in one step.
+
+    ## Parameters
+    path: the file to write.
+    text: the contents to write.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def text_hash(text: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a text, used to tell whether a page's text changed.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest() -> dict:
+    """
+    Reads the scrape manifest.
+
+    ## Returns
+    a dict of page ID (as a string) -> {title, lastrevid, hash, files}, or an empty dict
+    if nothing has been scraped incrementally yet.
+    """
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict):
+    """
+    Writes the scrape manifest (see load_manifest()).
+    """
+    write_text_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True))
+
+def wikitext_files() -> list[str]:
+    """
+    Returns the paths of every scraped wikitext (W) file, pages and notes alike.
+    """
+    paths = []
+    for folder in [SCRAPED_FILES_PATH, NOTES_PATH]:
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith("W.txt"):
+                paths.append(folder + filename)
+    return paths
+
+def raw_path(wikitext_path: str) -> str:
+    """
+    Returns the path of the raw text (R) file that goes with a wikitext (W) file.
+    """
+    return wikitext_path[:-len("W.txt")] + "R.txt"
+
+def remove_files(paths: list[str]):
+    """
+    Deletes the given files, skipping any that are already gone.
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+            print(f"Removed {path}")
+
+def refresh_file_index(folders: list[str] = None) -> dict:
+    """
+    Rescans the page folders and rebuilds the file index (see file_index()). Call this
+    after files were written or removed, e.g. after a scrape cycle.
+
+    ## Parameters
+    folders: the folders to rescan. Defaults to every folder indexed so far, plus pages/
+    and pages/notes/.
+    ## Returns
+    the whole index, folder -> {ID -> {"name", "W", "R"}}.
+    """
+    if folders is None:
+        folders = sorted(set(_file_index) | {SCRAPED_FILES_PATH, NOTES_PATH})
+    for folder in folders:
+        entries = {}
+        filenames = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        for filename in filenames:
+            match = PAGE_FILENAME_PATTERN.match(filename)
+            if match is None:
+                continue
+            name, _, file_id, kind = match.groups()
+            entry = entries.setdefault(int(file_id), {"name": name, "W": None, "R": None})
+            if entry[kind] is not None:
+                # a renamed page can leave its old files behind until the next purge
+                print(f"Ignoring {folder + filename}, already have {entry[kind]} for "
+                      f"ID {file_id}")
+                continue
+            entry[kind] = folder + filename
+        _file_index[folder] = entries
+    return _file_index
+
+def file_index(folder: str = SCRAPED_FILES_PATH) -> dict[int, dict]:
+    """
+    Returns the file index of a folder: page or notes ID -> {"name", "W", "R"}, where name
+    is the page name (or notes header) in the filenames and W/R are the file paths (None
+    if that file is missing). The folder is only scanned the first time it is asked for,
+    see refresh_file_index() to pick up changes.
+
+    ## Parameters
+    folder: pages/ (the default) or pages/notes/.
+    """
+    if folder not in _file_index:
+        refresh_file_index([folder])
+    return _file_index[folder]
+
+def page_file_path(file_id: int, kind: str, folder: str = SCRAPED_FILES_PATH) -> str:
+    """
+    Looks up the W or R file of a page or notes ID in the file index.
+
+    ## Parameters
+    file_id: the page ID, or the notes ID for pages/notes/.    
+    kind: "W" for the wikitext file, "R" for the raw text file.    
+    folder: pages/ (the default) or pages/notes/.
+    ## Returns
+    the path to the file.
+    """
+    path = file_index(folder).get(int(file_id), {}).get(kind)
+    if path is None:
+        raise FileNotFoundError(f"No {kind} file for ID {file_id} in {folder}")
+    return path
@@ -6,48 +6,87 @@ import os
 import re
 #import json
 #import requests
-from typing import Tuple
-import pandas as pd
-# static variables that lead to where the source material is located at.
+from typing import Tuple, TYPE_CHECKING
+# pandas is imported by the functions that use it, so importing this file stays fast
 #from bs4 import BeautifulSoup
-import secret_variables
-import mediawiki_api_calls
+import page_files
+import file_stats
+import dataset_export
+
+if TYPE_CHECKING:
+    import pandas as pd
 
-API_ENDPOINT = secret_variables.WIKI_URL + "/w/api.php"
 SCRAPED_FILES_PATH = "pages/"
 DATASETS_PATH = "datasets/"
 NOTES_PATH = "pages/notes/"
 NOTES_DATE_FINDER_REGEX = r"[0-9]{4} EST, [0-9]{2} [a-zA-Z]* [0-9]{4}"
+NOTES_SIGNATURE_PATTERN = re.compile(
+    r"(?P<hours>[0-9]{2})(?P<minutes>[0-9]{2}) EST, (?P<date>[0-9]{1,2} [a-zA-Z]+ [0-9]{4})")
+NOTES_DATE_PATTERN = re.compile(r"(?P<date>[0-9]{1,2} [a-zA-Z]* [0-9]{4})")
+NOTES_HOURS_PATTERN = re.compile(r"(?P<hours>[0-9]{2})(?P<minutes>[0-9]{2}) EST")
+REVISIONS_COLUMNS = ["Revision ID", "Page ID", "Timestamp", "Is Minor",
+                     "Revision Size (Bytes)", "Revision Size (Words)"]
 
 #mediawiki_api_calls.scrapecycle()
 
-filelist = os.listdir(SCRAPED_FILES_PATH)
-filelist.sort(key=lambda filename: filename[-9:-5])
-filelist = filelist[1:] # drops the notes folder
-
-noteslist = os.listdir(NOTES_PATH)
-noteslist.sort(key=lambda filename: filename[-9:-5])
-
-def compile_single_excel():
-    """
-    Saves all three datasets into one Excel file.
-    """
-    dfs = []
-    writer = pd.ExcelWriter(DATASETS_PATH+'combined_dataset.xlsx', engine='openpyxl')
-    sheetnames = ["Main Pages", "Discussion Notes", "Revisions"]
-    i=0
-    for dfname in ["main_pages_df", "discussion_notes_df", "revisions_df"]:
-        df = pd.read_csv(f"datasets/{dfname}.csv")
-        for colname in ["Timestamp", "Last Edited Time"]:
-            if colname in df.columns:
-                df[colname] = pd.to_datetime(df[colname])
-        df.to_excel(f"datasets/{dfname}.xlsx", sheet_name=sheetnames[i], index=False)
-        dfs.append(df)
-        i+=1
-    names = ["Main Pages", "Discussion Notes", "Revisions"]
-    for i, df in enumerate(dfs):
-        df.to_excel(writer, sheet_name = names[i], index=False)
-    writer.close()
+# the W/R files of every page and note are looked up in page_files.file_index()
+
+def compile_single_excel(frames: dict[str, "pd.DataFrame"] = None):
+    """
+    Saves all three datasets into one Excel file, plus an Excel file per dataset.
+
+    ## Parameters
+    frames: dataset name -> DataFrame, straight from the producers in datasets_creation.py.
+    Datasets left out are loaded from disk (see dataset_export.load_dataset()).
+    """
+    frames = dict(frames or {})
+    for dfname in dataset_export.DATASET_SHEETS:
+        if dfname not in frames:
+            frames[dfname] = dataset_export.load_dataset(dfname)
+    dataset_export.export_datasets(frames, ["xlsx", "combined_xlsx"])
+
+def revisions_frame(revisions: list[dict]) -> "pd.DataFrame":
+    """
+    Turns revision listing records (see mediawiki_api_calls.revision_metadata()) into
+    the revisions dataset columns, with the byte size of every revision computed from
+    the page sizes (see revision_byte_deltas()).
+
+    ## Parameters
+    revisions: a list of dicts containing revid, parentid, pageid, timestamp, minor, size.
+    ## Returns
+    a DataFrame with every REVISIONS_COLUMNS column except "Revision Size (Words)",
+    plus "Parent ID" and "Size".
+    """
+    import pandas as pd
+    revs_df = pd.DataFrame({
+        "Revision ID": [rev["revid"] for rev in revisions],
+        "Page ID": [rev["pageid"] for rev in revisions],
+        # timestamp raw looks like: 2025-04-13T05:14:42Z
+        "Timestamp": [rev["timestamp"] for rev in revisions],
+        "Is Minor": [rev["minor"] for rev in revisions],
+        "Parent ID": [rev["parentid"] for rev in revisions],
+        "Size": [rev["size"] for rev in revisions],
+    })
+    revs_df["Timestamp"] = pd.to_datetime(revs_df["Timestamp"], utc=True).dt.tz_convert(None)
+    revs_df["Timestamp"] = revs_df["Timestamp"] - pd.Timedelta(hours=5)
+    revs_df["Revision Size (Bytes)"] = revision_byte_deltas(revs_df)
+    return revs_df
+
+def revision_byte_deltas(revs_df: "pd.DataFrame") -> "pd.Series":
+    """
+    Computes how many bytes each revision added (or removed) from the page sizes alone:
+    each revision's size minus the size of the revision before it on the same page.
+    A page's first revision counts its whole size, as the compare API did.
+
+    ## Parameters
+    revs_df: a DataFrame with "Page ID", "Timestamp", "Revision ID" and "Size" columns,
+    holding every revision of each page in it.
+    ## Returns
+    a Series of byte differences aligned with revs_df.
+    """
+    ordered = revs_df.sort_values(["Page ID", "Timestamp", "Revision ID"])
+    deltas = ordered.groupby("Page ID")["Size"].diff().fillna(ordered["Size"])
+    return deltas.astype(int).reindex(revs_df.index)
 
 def altcat_cleanup(altcat: str) -> str:
     """
@@ -70,7 +109,7 @@ def pagename_cleanup(pagename: str) -> str:
         return "Userpage"
     return pagename
 
-def wordbytescount(pageid: int, isnotes: float = False) -> Tuple[int, int, float]:
+def wordbytescount(pageid: int, isnotes: float = False) -> Tuple[int, int, float, float]:
     """
     For a given page ID: calculate its word count, its bytes count, its text/format ratio,
     and its average word length.
@@ -84,49 +123,88 @@ def wordbytescount(pageid: int, isnotes: float = False) -> Tuple[int, int, float
     tfr: text/format ratio, calculated as raw text byte count / wikitext byte count.    
     wordlength: average length of words in the raw file, measured in # of letters.
     """
-    path = ""
-    wikifile, rawfile = "", ""
-    #print(pageid)
-    #print(f"{pageid}W")
-    if not isnotes:
-        path = SCRAPED_FILES_PATH
-        wikifile = [x for x in filelist if f"{pageid}W" in x][0]
-        rawfile = [x for x in filelist if f"{pageid}R" in x][0]
-    else:
-        path = NOTES_PATH
-        wikifile = [x for x in noteslist if f"{pageid}W" in x][0]
-        rawfile = [x for x in noteslist if f"{pageid}R" in x][0]
-    wordcount, bytescount, rawbytescount, wordlength = 0, 0, 0, 0
-    with open(path+wikifile, "r", encoding="utf-8") as f:
-        # UTF-8 means that some chars take up more than 1 byte
-        # Thus manual counting is necessary
-        bytescount = len(f.read())
-    with open(path+rawfile, "r", encoding="utf-8") as f:
-        # UTF-8 means that some chars take up more than 1 byte
-        # Thus manual counting is necessary
-        text = f.read()
-        wordcount = mediawiki_api_calls.get_wordcount_text(text)
-        rawbytescount = len(text)
-        wordlength = len(text) / wordcount
-    return wordcount, bytescount, rawbytescount / bytescount, wordlength
-
-def get_note_dt(notesid: int) -> pd.Timestamp:
+    return wordbytescounts([pageid], isnotes, workers=1)[0]
+
+def wordbytescounts(pageids: list[int], isnotes: bool = False,
+                    workers: int = file_stats.STATS_WORKERS
+                    ) -> list[Tuple[int, int, float, float]]:
+    """
+    wordbytescount() for many pages at once: the raw files are counted in parallel, in one
+    streaming pass each (see file_stats.py), and the wikitext files are never opened since
+    only their size on disk is needed.
+
+    ## Parameters
+    pageids: page IDs (or notes IDs).    
+    isnotes: default False; determines if the function should look in pages/ or pages/notes/.    
+    workers: how many processes to count with.
+    ## Returns
+    a (wordcount, bytescount, tfr, wordlength) tuple per ID, in the same order.
+    """
+    folder = NOTES_PATH if isnotes else SCRAPED_FILES_PATH
+    wikifiles = [page_files.page_file_path(pageid, "W", folder) for pageid in pageids]
+    rawfiles = [page_files.page_file_path(pageid, "R", folder) for pageid in pageids]
+    raw_stats = file_stats.many_file_stats(rawfiles, workers)
+    counts = []
+    for wikifile, rawfile in zip(wikifiles, rawfiles):
+        # UTF-8 means that some chars take up more than 1 byte, so sizes come from the disk
+        bytescount = os.stat(wikifile).st_size
+        stats = raw_stats[rawfile]
+        counts.append((stats["words"], bytescount, stats["bytes"] / bytescount,
+                       stats["word_length"]))
+    return counts
+
+def get_note_dt(notesid: int) -> "pd.Timestamp":
     """
     Given a main page or discussion note ID:
     return the datetime associated with its posting.
     """
+    return get_note_dts([notesid]).iloc[0]
+
+def get_note_dts(notesids: list[int]) -> "pd.Series":
+    """
+    Given discussion note IDs: return the datetime associated with each note's posting,
+    extracted from every note at once.
+
+    Notes are signed like "1234 EST, 5 May 2025". Some notes have two datetimes (a reply,
+    or an edit later on); the more recent one is chosen. Notes without a whole signature
+    fall back to the first date and the first "HHMM EST" found anywhere in them, each on
+    its own.
+
+    ## Parameters
+    notesids: discussion note IDs.
+    ## Returns
+    a Series of datetimes indexed by note ID (NaT for a note with no date at all).
+    """
+    import pandas as pd
+
+    bodies = {}
+    for notesid in notesids:
+        with open(page_files.page_file_path(notesid, "R", NOTES_PATH), "r",
+                  encoding="utf-8") as f:
+            bodies[notesid] = f.read()
+    bodies = pd.Series(bodies, index=pd.Index(notesids, name="Page ID"), dtype=object)
+
+    signatures = bodies.str.extractall(NOTES_SIGNATURE_PATTERN)
+    note_dts = _note_datetimes(signatures).groupby(level=0).max()
+    note_dts = note_dts.reindex(bodies.index)
+
+    unsigned = note_dts.isna()
+    if unsigned.any():
+        dates = bodies[unsigned].str.extract(NOTES_DATE_PATTERN)
+        hours = bodies[unsigned].str.extract(NOTES_HOURS_PATTERN)
+        note_dts[unsigned] = _note_datetimes(dates.join(hours))
+    return note_dts
+
+def _note_datetimes(found: "pd.DataFrame") -> "pd.Series":
+    """
+    Turns extracted "date", "hours" and "minutes" columns into datetimes in one go.
+    """
+    import pandas as pd
 
-    dt_pattern = r"[0-9]{1,2} [a-zA-Z]* [0-9]{4}"
-    hours_pattern = r"[0-9]{4} EST"
-    path = NOTES_PATH
-    #wikifile = [x for x in noteslist if f"{pageid}W" in x][0]
-    rawfile = [x for x in noteslist if f"{notesid}R" in x][0]
-    with open(path+rawfile, "r", encoding="utf-8") as f:
-        filebody = f.read()
-        #mydt = filebody.split("\n\n")
-        ddmmyy = re.search(dt_pattern, filebody)[0]
-        # some notes have two datetimes; choose more recent
-        hourminute = re.search(hours_pattern, filebody)[0][:5]
-        pd_dt = pd.to_datetime(ddmmyy) + pd.Timedelta(hours=int(hourminute[:2]),
-                                                    minutes=int(hourminute[2:]))
-        return pd_dt
+    dates = pd.to_datetime(found["date"], format="%d %B %Y", errors="coerce")
+    # abbreviated months and other odd spellings get the slower guessing parser
+    odd = dates.isna() & found["date"].notna()
+    if odd.any():
+        dates[odd] = pd.to_datetime(found.loc[odd, "date"], format="mixed", errors="coerce")
+    minutes = (pd.to_numeric(found["hours"]) * 60 + pd.to_numeric(found["minutes"])).fillna(0)
+    return dates + pd.to_timedelta(minutes, unit="m")
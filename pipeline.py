@@ -0,0 +1,202 @@
+"""
+Contains a small pipeline runner for the dataset stages in datasets_creation.py.
+
+A pipeline is a dict of stage name -> stage, where a stage is a dict of:
+- run: the function that does the stage's work and writes its outputs.
+- inputs: what the stage reads. A path ending in "/" stands for the files in that folder,
+any other path for that file, and a function for something only it can tell (such as the
+latest revision IDs in the API), returning any JSON-able value.
+- outputs: the files the stage writes.
+- after: default []; stages that must finish first when they run in the same pipeline run.
+
+Stages run in parallel as soon as the stages they come after are done. A function input is
+called once per run_pipeline() call, and its answer is shared by every stage fingerprint
+and by the stages themselves through input_value(). Before running, a stage's inputs are
+fingerprinted; if the fingerprint matches the one saved after its last successful run (in
+PIPELINE_STATE_PATH) and its outputs are all there, it is skipped.
+A stage whose input fingerprint or run fails is reported, and the stages after it are not
+run. A timing report is printed at the end.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import page_files
+
+PIPELINE_STATE_PATH = "pipeline_state.json" # kept outside datasets/ like the scrape manifest
+PIPELINE_WORKERS = 4
+
+_state_lock = threading.Lock()
+_run_inputs = None # function input -> its value, while run_pipeline() runs
+# held while a function input is called, so two stages never make the same call at once
+_run_inputs_lock = threading.Lock()
+
+def input_value(source):
+    """
+    Returns the value of a function input (see the module docstring). During a
+    run_pipeline() call the function is only called the first time, so the fingerprints
+    and the stage bodies all see the same value, e.g. one category snapshot per run instead
+    of one per stage. Outside of a run it is just called.
+    """
+    with _run_inputs_lock:
+        if _run_inputs is None:
+            return source()
+        if source not in _run_inputs:
+            _run_inputs[source] = source()
+        return _run_inputs[source]
+
+def fingerprint_input(source) -> str:
+    """
+    Returns a fingerprint of one stage input (see the module docstring).
+
+    Folders are fingerprinted by the name, size and modification time of their files, which
+    is enough to notice a scrape cycle rewriting them without reading every page; single files
+    by their contents.
+    """
+    digest = hashlib.sha256()
+    if callable(source):
+        digest.update(json.dumps(input_value(source), sort_keys=True, default=str).encode("utf-8"))
+    elif source.endswith("/"):
+        if os.path.isdir(source):
+            for entry in sorted(os.scandir(source), key=lambda entry: entry.name):
+                if entry.is_file():
+                    stat = entry.stat()
+                    digest.update(f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n"
+                                  .encode("utf-8"))
+    elif os.path.isfile(source):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(b"missing")
+    return digest.hexdigest()
+
+def _input_name(source) -> str:
+    return source.__name__ if callable(source) else source
+
+def fingerprint_stage(stage: dict) -> dict[str, str]:
+    """
+    Returns input name -> fingerprint for every input of a stage.
+    """
+    return {_input_name(source): fingerprint_input(source) for source in stage["inputs"]}
+
+def load_state() -> dict:
+    """
+    Reads the saved input fingerprints: stage name -> {input name -> fingerprint}.
+    """
+    if not os.path.exists(PIPELINE_STATE_PATH):
+        return {}
+    with open(PIPELINE_STATE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_stage_state(stage_name: str, fingerprints: dict[str, str]):
+    with _state_lock:
+        state = load_state()
+        state[stage_name] = fingerprints
+        page_files.write_text_atomic(PIPELINE_STATE_PATH,
+                                     json.dumps(state, indent=2, sort_keys=True))
+
+def _run_stage(stage_name: str, stage: dict, saved: dict, force: bool) -> tuple[str, float]:
+    """
+    Fingerprints a stage's inputs and runs it unless it is up to date.
+
+    ## Returns
+    "ran" or "skipped", and how long fingerprinting and running took in seconds.
+    """
+    start_time = time.perf_counter()
+    fingerprints = fingerprint_stage(stage)
+    outputs_exist = all(os.path.exists(path) for path in stage["outputs"])
+    if not force and outputs_exist and saved.get(stage_name) == fingerprints:
+        print(f"[{stage_name}] up to date, skipped")
+        return "skipped", time.perf_counter() - start_time
+    print(f"[{stage_name}] running")
+    stage["run"]()
+    # the inputs as they were when the stage started, so a change made while it ran is
+    # still picked up next time
+    _save_stage_state(stage_name, fingerprints)
+    elapsed = time.perf_counter() - start_time
+    print(f"[{stage_name}] done in {elapsed:.2f}s")
+    return "ran", elapsed
+
+def run_pipeline(stages: dict[str, dict], targets: list[str] = None, force: bool = False,
+                 workers: int = PIPELINE_WORKERS) -> dict[str, dict]:
+    """
+    Runs the given stages of a pipeline, in parallel where the "after" lists allow it,
+    skipping the ones that are up to date, and prints a timing report.
+
+    ## Parameters
+    stages: the pipeline, stage name -> stage (see the module docstring).
+    targets: default every stage; the names of the stages to run. Stages listed in "after"
+    but not in targets are not run, their outputs are taken as they are on disk.
+    force: default False; run every target even if it is up to date.
+    workers: how many stages may run at once.
+    ## Returns
+    stage name -> {"status": "ran", "skipped", "failed" or "blocked", "seconds"}.
+    """
+    if targets is None:
+        targets = list(stages)
+    unknown = [name for name in targets if name not in stages]
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages {unknown}, expected some of {list(stages)}")
+    waiting_on = {name: {before for before in stages[name].get("after", [])
+                         if before in targets}
+                  for name in targets}
+    global _run_inputs
+    saved = load_state()
+    start_time = time.perf_counter()
+    _run_inputs = {}
+    try:
+        results = _run_stages(stages, targets, waiting_on, saved, force, workers)
+    finally:
+        _run_inputs = None
+    total = time.perf_counter() - start_time
+
+    print(f"{'stage':<16}{'status':<10}{'seconds':>10}")
+    for name in targets:
+        print(f"{name:<16}{results[name]['status']:<10}{results[name]['seconds']:>10.2f}")
+    print(f"{'total':<26}{total:>10.2f}")
+    return results
+
+def _run_stages(stages: dict[str, dict], targets: list[str], waiting_on: dict[str, set],
+                saved: dict, force: bool, workers: int) -> dict[str, dict]:
+    """
+    Does the scheduling for run_pipeline().
+
+    ## Returns
+    stage name -> {"status", "seconds"}.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        started = {}
+        while len(results) < len(targets):
+            resolved = len(results)
+            for name in targets:
+                if name in results or name in running.values():
+                    continue
+                failed_before = [before for before in waiting_on[name] if
+                                 results.get(before, {}).get("status") in ("failed", "blocked")]
+                if failed_before:
+                    print(f"[{name}] not run, {', '.join(failed_before)} did not finish")
+                    results[name] = {"status": "blocked", "seconds": 0.0}
+                elif all(before in results for before in waiting_on[name]):
+                    started[name] = time.perf_counter()
+                    running[executor.submit(_run_stage, name, stages[name], saved,
+                                            force)] = name
+            if not running:
+                if len(results) == resolved:
+                    raise ValueError(f"Pipeline stages wait on each other: "
+                                     f"{[name for name in targets if name not in results]}")
+                continue # the last stages were just blocked
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    status, seconds = future.result()
+                except Exception as error:
+                    print(f"[{name}] failed: {error!r}")
+                    status, seconds = "failed", time.perf_counter() - started[name]
+                results[name] = {"status": status, "seconds": seconds}
+    return results
@@ -0,0 +1,75 @@
+"""
+Regenerates the raw text (R) files from the wikitext (W) files already on disk, for when a
+cleaner rule in regex_cleaners.py changes. No API calls are made, so this only costs local
+CPU time instead of a whole scrapecycle().
+
+Every W file in pages/ and pages/notes/ is cleaned in a process pool, and only the R files
+whose text actually changed are rewritten. A page that only got the cheap_strip() fallback
+keeps its old R file.
+
+This script requires some local files generated by the API calls.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import regex_cleaners
+import page_files
+
+RECLEAN_WORKERS = os.cpu_count() or 1
+RECLEAN_CHUNKSIZE = 16 # files handed to a worker at a time
+
+def reclean_file(wikitext_path: str) -> tuple[str, int, bool]:
+    """
+    Cleans one W file and rewrites its R file if the cleaned text changed.
+
+    ## Parameters
+    wikitext_path: path to the W file.
+    ## Returns
+    the R file path, the size of the W file in bytes and whether the R file was rewritten.
+    """
+    with open(wikitext_path, 'r', encoding='utf-8') as f:
+        wikitext = f.read()
+    rawtext, complete = regex_cleaners.clean_page(wikitext)
+    rawtext_path = page_files.raw_path(wikitext_path)
+    if not complete and os.path.isfile(rawtext_path):
+        # a timed out page would only overwrite a proper clean with the fallback
+        return rawtext_path, len(wikitext.encode("utf-8")), False
+    old_rawtext = None
+    if os.path.isfile(rawtext_path):
+        with open(rawtext_path, 'r', encoding='utf-8') as f:
+            old_rawtext = f.read()
+    changed = rawtext != old_rawtext
+    if changed:
+        page_files.write_text_atomic(rawtext_path, rawtext)
+    return rawtext_path, len(wikitext.encode("utf-8")), changed
+
+def reclean_all(workers: int = RECLEAN_WORKERS) -> list[str]:
+    """
+    Re-cleans every scraped W file and prints how fast it went.
+
+    ## Parameters
+    workers: how many processes to clean with.
+    ## Returns
+    the paths of the R files that were rewritten.
+    """
+    paths = page_files.wikitext_files()
+    start_time = time.perf_counter()
+    rewritten = []
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for rawtext_path, size, changed in executor.map(reclean_file, paths,
+                                                        chunksize=RECLEAN_CHUNKSIZE):
+            total_bytes += size
+            if changed:
+                rewritten.append(rawtext_path)
+                print(f"Rewrote {rawtext_path}")
+    elapsed = time.perf_counter() - start_time
+    print(f"Re-cleaned {len(paths)} files ({total_bytes / 1e6:.2f} MB of wikitext) "
+          f"in {elapsed:.2f}s with {workers} workers: "
+          f"{len(paths) / max(elapsed, 1e-9):.1f} files/s, "
+          f"{total_bytes / 1e6 / max(elapsed, 1e-9):.2f} MB/s")
+    print(f"{len(rewritten)} R files changed, {len(paths) - len(rewritten)} unchanged")
+    return rewritten
+
+if __name__ == "__main__":
+    reclean_all()
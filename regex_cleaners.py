@@ -1,8 +1,17 @@
 """
 Contains functions that de-formats wikitext using RegEx.
+deformat_cycle() cleans a whole page with the chain of deformat_* passes by default, which
+is the faster cleaner on well-formed pages. tokenize_wikitext() cleans a page in one scan
+instead and handles nested markup properly; set CLEANER_MODE to "tokenizer" to use it.
 """
 import re
-from bs4 import BeautifulSoup
+import html
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import html_stripper
+import text_cache
 #import pandas as pd
 
 RESEARCH_CITATIONS = """
@@ -13,172 +22,673 @@ https://stackoverflow.com/questions/2503413/regular-expression-to-stop-at-first-
 on the usage of non-greedy (.*?)
 """
 
+# Patterns are compiled once here instead of on every call.
+MISC_ELEMENTS = ["\'\'\'", "\'\'", "----"]
+HEADING_PATTERN = re.compile(r"[=]{3,5}(.*?)[=]{3,5}")
+# The bracket/newline classes keep a tag or link that never closes from being rescanned to
+# the end of the line from every "<div " or "[[" before it (cleaner_benchmarks.ADVERSARIAL_CASES).
+COLLAPSIBLE_PATTERN = re.compile(r"<div ([^<>\n]*?) data-expandtext=\"([^\"<>\n]*)\">")
+MISC_PATTERNS_REPLACEMENTS = [
+    (HEADING_PATTERN, r"\1"), # turns === test === to test
+    (re.compile(r"<br>"), " "),
+    (re.compile(r"----\n<br>\n----"), "="),
+    (re.compile(r"<hr>"), "----"),
+    (COLLAPSIBLE_PATTERN, r"Collapsible Section: \2"),
+]
+WIKITABLE_PATTERN = re.compile(r"(?s){\| class=\"wikitable( sortable){0,1}\"(.*?)\|}")
+WIKITABLE_ROWHEADER_PATTERN = re.compile(r"[^ ]([!|] .*?)[\n]")
+# These regex patterns required a bunch of Stack Overflow dumpster diving to figure out.
+# See the string under the file docstring.
+# I only remembered to save some threads, so others are lost to my forgetfulness.
+NOTICEBOX_PATTERN = re.compile(
+    r"(?s){{Notice(.*?) \| header =[\n]{0,1}(.*?)\n \| text = (.*?)[\n]{0,1}}}")
+QUOTES_PATTERN = re.compile(
+    r"(?s){{Quote(.*?)\| quote =[ \n]{0,1}(.*?)\n \| speaker = (.*?)\n \| source =[ ]{0,1}\n}}")
+EXTERNAL_LINK_PATTERN = re.compile(r"\[http[s]{0,1}:.*? (.{1,}?)\]")
+INTERNAL_LINK_PATTERN = re.compile(r"\[\[([^\[:|\n]*?)\]\]")
+INTERNAL_LINK_DISPLAYTEXT_PATTERN = re.compile(r"\[\[[^\[\]|\n]*\|([^\[\]\n]*)\]\]")
+CATEGORIES_LINK_PATTERN = re.compile(r"\[\[Category:.*?\]\]")
+FILE_LINK_PATTERN = re.compile(r"\[\[File:(.*?)\]\]")
+XIB_PARAM_PATTERN = re.compile(r"(?s)(data|header|label|ddata1|ddata2) =[ ]{0,1}(.*?)( \||}})")
+INFOBOX_PATTERN = re.compile(r"(?s){{Infobox entity\n(.*?)}}\n}}")
+INFOBOX_BADLIST = ["test", "placeholder", ""]
+CLEAN_CACHE_SIZE = 2048 # cleaned texts kept in memory by deformat_cycle()
+CLEAN_CACHE_PERSISTENT = False # also keep cleaned texts on disk in text_cache
+CLEANER_MODE = "regex" # "regex" for deformat_cycle_regex(), "tokenizer" for tokenize_wikitext()
+QUOTES_REPLACEMENT = r"\2\n\3\n\n" # also used for notice boxes
+# seconds deformat_cycle() may spend on a page, None for no limit. It is checked between
+# regex matches, so it can't cut short one slow search; the patterns have to stay linear.
+CLEAN_TIME_BUDGET = 2.0
+MAX_NESTING_DEPTH = 40 # markup nested deeper than this only gets cheap_strip()
+# Fallback for pages that blow the time budget: drops brackets, template names, bold/italics,
+# heading markers and HTML tags, keeping link display text. No backtracking to speak of.
+CHEAP_STRIP_PATTERN = re.compile(
+    r"\[\[(?:[^\[\]|]*\|)?|\]\]|\{\{[^{}|\n]*|\}\}|\{\||\|\}|'{2,}|={2,}|<[^<>\n]*>")
+
+# Everything tokenize_wikitext() stops at; text between these is copied as is.
+TOKEN_PATTERN = re.compile(r"\{\{|\{\||\[\[|\[https?:|={3,}|'{2,}|-{4,}|<br>|<hr>|<div ")
+TEMPLATE_BRACKETS_PATTERN = re.compile(r"\{\{|\}\}")
+TABLE_BRACKETS_PATTERN = re.compile(r"\{\||\|\}")
+LINK_BRACKETS_PATTERN = re.compile(r"\[\[|\]\]")
+SIMPLE_LINK_PATTERN = re.compile(r"\[\[[^\[\]]*\]\]") # nothing nested, no pairing needed
+EXTERNAL_LINK_TOKEN_PATTERN = re.compile(r"\[https?:[^ \]\n]* ([^\]\n]+)\]")
+
+# What markup_is_well_formed() looks for.
+LINK_RUN_LIMIT = 4 # this many links opened in a row ("[[[[[[[[") is broken markup
+# The parts QUOTES_PATTERN, NOTICEBOX_PATTERN, INFOBOX_PATTERN and WIKITABLE_PATTERN look for,
+# in order; a tuple is a part that can take either form.
+BLOCK_MARKUP_PARTS = [
+    ["{{Quote", "| quote =", "\n | speaker = ", ("\n | source =\n}}", "\n | source = \n}}")],
+    ["{{Notice", " | header =", "\n | text = ", "}}"],
+    ["{{Infobox entity\n", "}}\n}}"],
+    ["{| class=\"wikitable", "|}"],
+]
+TEMPLATE_GROUP_PATTERN = re.compile(r"\\[1-9]") # a replacement that is just one group
+# the text every match of a pattern passed to sub_until_stable() starts with
+PATTERN_OPENERS = {
+    WIKITABLE_PATTERN: "{| class=\"wikitable",
+    NOTICEBOX_PATTERN: "{{Notice",
+    QUOTES_PATTERN: "{{Quote",
+    EXTERNAL_LINK_PATTERN: "[http",
+    INTERNAL_LINK_PATTERN: "[[",
+    INTERNAL_LINK_DISPLAYTEXT_PATTERN: "[[",
+    CATEGORIES_LINK_PATTERN: "[[Category:",
+    FILE_LINK_PATTERN: "[[File:",
+    INFOBOX_PATTERN: "{{Infobox entity\n",
+}
+# a tag with no ">" before the next tag or the end of the text
+UNCLOSED_TAG_PATTERN = re.compile(r"<[a-zA-Z/!?][^<>]*(?:<|\Z)")
+
+def _check_deadline(deadline: float):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise TimeoutError("ran out of time cleaning wikitext")
+
+def sub_until_stable(pattern: re.Pattern, replacement, text: str, opener: str = None,
+                     deadline: float = None) -> str:
+    """
+    Replaces every match of a pattern, repeating until nothing matches any more, with the
+    same result as the old `while re.search(): re.sub(count=1)` loops: the leftmost match
+    is always replaced first, even when it only exists because of an earlier replacement.
+
+    The loops rescanned and copied the whole text once per match. Here the matches are
+    taken left to right in one scan, and the scan only starts over when a replacement could
+    glue onto the text around it to form a new match: that is when the pattern's opener
+    (PATTERN_OPENERS) shows up in the replacement or across its edges, e.g. the "[[" left
+    behind by "[[[[x]]" in broken markup. The scan then starts over just before the
+    replacement: an opener further back would already have matched if it could. The one
+    exception is the link patterns that stop at a "[", where the "[[" of "[[[[a]]b]]" only
+    matches once the inner link is gone, so a scan that replaced anything is followed by
+    another one.
+
+    ## Parameters
+    pattern: a compiled pattern.    
+    replacement: a replacement string or function, as for re.sub().    
+    text: the text to clean.    
+    opener: the text every match starts with, PATTERN_OPENERS[pattern] by default.    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.
+    ## Returns
+    the text with no matches of the pattern left.
+    """
+    if opener is None:
+        opener = PATTERN_OPENERS[pattern]
+    keep = len(opener) - 1 # the characters before a replacement a new match could start in
+    if callable(replacement):
+        replace = replacement
+    elif TEMPLATE_GROUP_PATTERN.fullmatch(replacement):
+        # expand() parses the template on every call; a plain group is just looked up
+        group = int(replacement[1:])
+        replace = lambda match: match[group] or ""
+    else:
+        replace = lambda match: match.expand(replacement)
+    pieces = []
+    position = 0
+    replaced = False
+    while True:
+        last = position
+        new = ""
+        for match in pattern.finditer(text, position):
+            replaced = True
+            _check_deadline(deadline)
+            start, end = match.span()
+            if start - last >= keep:
+                before = text[start-keep:start]
+            else:
+                # reaches back into the previous replacements
+                before = text[last:start]
+                index = len(pieces)
+                while len(before) < keep and index:
+                    index -= 1
+                    before = pieces[index] + before
+                before = before[-keep:]
+            pieces.append(text[last:start])
+            new = replace(match)
+            if opener[0] in before or opener[0] in new:
+                glue = (before + new + text[end:end+keep]).find(opener)
+                if glue != -1 and glue < len(before) + len(new):
+                    # start over from just before the replacement, in the text as it is now
+                    done = "".join(pieces)
+                    text = done + new + text[end:]
+                    position = max(len(done) - keep, 0)
+                    pieces = [text[:position]]
+                    break
+            pieces.append(new)
+            last = end
+        else:
+            pieces.append(text[last:])
+            if not replaced:
+                return "".join(pieces)
+            text = "".join(pieces)
+            pieces = []
+            position = 0
+            replaced = False
+
+def _cleaner_version() -> str:
+    """
+    Returns a tag that changes whenever the cleaning code does: a hash of the source of
+    this file and html_stripper.py. Cached cleaned texts are stored under it, so editing
+    any cleaner rule leaves the old entries behind instead of serving stale text.
+    """
+    digest = hashlib.sha256()
+    for path in [__file__, html_stripper.__file__]:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+CLEANER_VERSION = _cleaner_version()
+_clean_cache = OrderedDict() # (modes, text hash) -> cleaned text, least recently used first
+_clean_cache_lock = threading.Lock() # deformat_cycle() is called from the API fetching threads
+clean_cache_stats = {"hits": 0, "misses": 0}
+
 def deformat_cycle(wikitext: str) -> str:
+    """
+    Strips all wikitext formatting from a page and removes any leftover HTML.
+
+    The same wikitext gets cleaned over and over (unchanged pages, reverted revisions, the
+    previous revision in a word count diff), so results are remembered by a hash of the
+    wikitext: the last CLEAN_CACHE_SIZE in memory and, if CLEAN_CACHE_PERSISTENT is set,
+    all of them in text_cache under the current CLEANER_VERSION.
+    """
+    mode = f"{CLEANER_MODE}-{html_stripper.HTML_STRIP_MODE}"
+    key = (mode, hashlib.sha256(wikitext.encode("utf-8")).hexdigest())
+    with _clean_cache_lock:
+        if key in _clean_cache:
+            _clean_cache.move_to_end(key)
+            clean_cache_stats["hits"] += 1
+            return _clean_cache[key]
+    namespace = f"clean-{CLEANER_VERSION}-{mode}"
+    cleaned = text_cache.cache_get(namespace, key[1]) if CLEAN_CACHE_PERSISTENT else None
+    if cleaned is None:
+        cleaned, complete = clean_page(wikitext)
+        if not complete:
+            # a cheap_strip() fallback depends on how busy the machine was, so it is not
+            # cached; the page gets another go next time
+            with _clean_cache_lock:
+                clean_cache_stats["misses"] += 1
+            return cleaned
+        if CLEAN_CACHE_PERSISTENT:
+            text_cache.cache_put(namespace, key[1], cleaned)
+    with _clean_cache_lock:
+        clean_cache_stats["misses"] += 1
+        _clean_cache[key] = cleaned
+        if len(_clean_cache) > CLEAN_CACHE_SIZE:
+            _clean_cache.popitem(last=False)
+    return cleaned
+
+def deformat_cycle_uncached(wikitext: str, mode: str = None) -> str:
+    """
+    Does the work for deformat_cycle(): strips all wikitext formatting from a page, then
+    removes any leftover HTML (see html_stripper.py).
+
+    Broken markup (see markup_is_well_formed()) sends the regex passes into heavy
+    backtracking, so a page that has any is cleaned by tokenize_wikitext() in either mode.
+    If cleaning any page takes longer than CLEAN_TIME_BUDGET it gets cheap_strip() instead,
+    so one bad page cannot stall a scrape.
+
+    ## Parameters
+    wikitext: the wikitext of a page.    
+    mode: "regex" or "tokenizer", see CLEANER_MODE (the default).
+    ## Returns
+    the plain text of the page.
+    """
+    return clean_page(wikitext, mode)[0]
+
+def clean_page(wikitext: str, mode: str = None) -> tuple[str, bool]:
+    """
+    Cleans a page like deformat_cycle_uncached(), but also says whether the page timed out,
+    so callers can avoid storing the fallback.
+
+    ## Parameters
+    wikitext: the wikitext of a page.    
+    mode: "regex" or "tokenizer", CLEANER_MODE if not given.    
+    ## Returns
+    the plain text, and False if it is only the cheap_strip() fallback.
+    """
+    if mode is None:
+        mode = CLEANER_MODE
+    if mode not in ("regex", "tokenizer"):
+        raise ValueError(f"Unknown cleaner mode {mode!r}, expected 'regex' or 'tokenizer'")
+    deadline = None
+    if CLEAN_TIME_BUDGET is not None:
+        deadline = time.perf_counter() + CLEAN_TIME_BUDGET
+    try:
+        if mode == "regex" and markup_is_well_formed(wikitext):
+            return deformat_cycle_regex(wikitext, deadline), True
+        return html_stripper.strip_html(tokenize_wikitext(wikitext, deadline),
+                                        deadline=deadline), True
+    except TimeoutError:
+        print(f"Cleaning a {len(wikitext)} character page took over {CLEAN_TIME_BUDGET}s, "
+              "falling back to a plain strip")
+        return cheap_strip(wikitext), False
+
+def markup_is_well_formed(wikitext: str) -> bool:
+    """
+    Screens a page for the broken markup that makes the regex passes backtrack over the
+    rest of the page again and again (see cleaner_benchmarks.ADVERSARIAL_CASES):
+    - more "[[" than "]]", or LINK_RUN_LIMIT links opened in a row.
+    - a "[[" after the last "]]" on its line, which the link patterns rescan the line for.
+    - a Quote, notice box, Infobox or wikitable whose remaining parts (BLOCK_MARKUP_PARTS)
+    are missing after the last one. If they are there, every one of them matches on the
+    first try.
+    - an external link without a space and a "]" after it on its line.
+    - an HTML tag without its ">", which html.parser rescans the rest of the page for.
+
+    This is a screen made of str.count()/find() calls and one linear pattern, a few percent
+    of the cost of the regex passes, not a parser; it errs on the side of calling a page
+    broken.
+
+    ## Parameters
+    wikitext: the wikitext of a page.
+    ## Returns
+    whether the page is safe to clean with the regex passes.
+    """
+    # templates and tables are only matched by the block patterns, checked below
+    if wikitext.count("[[") > wikitext.count("]]") or "[[" * LINK_RUN_LIMIT in wikitext:
+        return False
+    for line in wikitext.split("\n"):
+        if line.rfind("[[") > line.rfind("]]"):
+            return False
+    for parts in BLOCK_MARKUP_PARTS:
+        position = wikitext.rfind(parts[0])
+        if position == -1:
+            continue
+        position += len(parts[0])
+        for part in parts[1:]:
+            found = [(wikitext.find(form, position), form)
+                     for form in (part if isinstance(part, tuple) else (part,))]
+            found = [(index, form) for index, form in found if index != -1]
+            if not found:
+                return False
+            index, form = min(found)
+            position = index + len(form)
+    for link in wikitext.split("[http")[1:]:
+        space = link.find(" ")
+        close = link.find("]", space + 2) if space != -1 else -1
+        line_end = link.find("\n")
+        if close == -1 or line_end != -1 and line_end < close:
+            return False
+    return UNCLOSED_TAG_PATTERN.search(wikitext) is None
+
+def cheap_strip(wikitext: str) -> str:
+    """
+    Strips the most common wikitext and HTML markup in a single regex pass. Far rougher
+    than deformat_cycle(), but it takes linear time no matter how broken the markup is.
+    """
+    return html.unescape(CHEAP_STRIP_PATTERN.sub("", wikitext))
+
+def deformat_cycle_regex(wikitext: str, deadline: float = None) -> str:
     """
     runs all the other deformats sequentially.
+    This is the "regex" mode of deformat_cycle(), and what the "tokenizer" mode is validated
+    against (see cleaner_validation.py).
+    deadline is a time.perf_counter() time to give up at by raising TimeoutError.
     """
     newtext = wikitext
     for deformat in [deformat_infobox_entity, deformat_wikitable, deformat_quotes,
                       deformat_links, deformat_misc]:
-        newtext = deformat(newtext)
+        newtext = deformat(newtext, deadline)
         #print(newtext)
         #print("\n"*3)
-    return BeautifulSoup(newtext,features="html.parser").get_text()
+    return html_stripper.strip_html(newtext, deadline=deadline)
 
-def deformat_misc(wikitext: str) -> str:
+def deformat_misc(wikitext: str, deadline: float = None) -> str:
     """
     Removes various minor wikitext formatting artifacts not covered by the other functions.
 
     ## Parameters
-    wikitext: a block of text with MediaWiki formatting elements not cleaned up by the other funcs
+    wikitext: a block of text with MediaWiki formatting elements not cleaned up by the other funcs    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.
     ## Returns
     a block of text that roughly approaches "plain text".
     """
     newtext = wikitext
-    elements_list = ["\'\'\'", "\'\'", "----"]
-    regex_replacement_dict = {
-        r"[=]{3,5}(.*?)[=]{3,5}": r"\1", # turns === test === to test
-        r"<br>": " ",
-        r"----\n<br>\n----": "=",
-        r"<hr>": "----",
-        r"<div (.*?) data-expandtext=\"(.*?)\">": r"Collapsible Section: \2",
-    }
-    for element in elements_list:
+    for element in MISC_ELEMENTS:
         newtext = newtext.replace(element, "")
-    for pattern, replacement in regex_replacement_dict.items():
-        if re.search(pattern, newtext):
-            newtext = re.sub(pattern, replacement, newtext)
+    for pattern, replacement in MISC_PATTERNS_REPLACEMENTS:
+        _check_deadline(deadline)
+        newtext = pattern.sub(replacement, newtext)
     return newtext
 
 
-def deformat_wikitable(wikitext: str) -> str:
+def deformat_wikitable(wikitext: str, deadline: float = None) -> str:
     """
     Given a block of text containing one or more wikitable objects: strip formatting
     and return the text with the table contents laid out in raw format.
 
     ## Parameters
-    wikitext: a block of text with MediaWiki formatting, containing one or more quote objects
+    wikitext: a block of text with MediaWiki formatting, containing one or more quote objects    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.
     ## Returns
     a block of text with raw table contents
     """
-    newtext = wikitext
-    wikitable_pattern = r"(?s){\| class=\"wikitable( sortable){0,1}\"(.*?)\|}"
-    wikitable_rowheader_pattern = r"[^ ]([!|] .*?)[\n]"
-    wikitable_title_pattern = r"\|\+ (.*?)\n\|"
-    while re.search(wikitable_pattern, newtext):
-        start, end = re.search(wikitable_pattern, newtext).span()
-        snip = newtext[start:end]
-
-        rowsheads = re.findall(wikitable_rowheader_pattern, snip)
-        title = re.findall(wikitable_title_pattern, snip)
-        #print(rowsheads)
-
-        rawdata = ""
-        if title:
-            rawdata += title[0].strip(" ")
+    return sub_until_stable(WIKITABLE_PATTERN, _wikitable_rawdata, wikitext, deadline=deadline)
+
+def _wikitable_rawdata(match: re.Match) -> str:
+    """
+    Replacement function for deformat_wikitable(): lays out the title, headers and rows
+    of one matched wikitable in raw format.
+    """
+    snip = match.group(0)
+    # a row can only match up to a newline, so stopping at the last one gives the same rows
+    # without every row start on an unterminated last line scanning to the end
+    rowsheads = WIKITABLE_ROWHEADER_PATTERN.findall(snip, 0, snip.rfind("\n") + 1)
+    title = _wikitable_title(snip)
+    #print(rowsheads)
+
+    rawdata = ""
+    if title is not None:
+        rawdata += title.strip(" ")
+        rawdata += "\n"
+    for rowhead in rowsheads:
+        #print(row)
+        if "wikitable" not in rowhead:
+            #print(x.strip(" ") for x in row.split(" || "))
+            rawdata += rowhead.strip(" ")
             rawdata += "\n"
-        for rowhead in rowsheads:
-            #print(row)
-            if "wikitable" not in rowhead:
-                #print(x.strip(" ") for x in row.split(" || "))
-                rawdata += rowhead.strip(" ")
-                rawdata += "\n"
-
-        newtext = re.sub(wikitable_pattern, rawdata, newtext, count=1)
-    return newtext
+    # the raw data used to be passed to re.sub() as the replacement string, which
+    # expands backslash escapes in it; expand() keeps the output identical.
+    # Parsing the template is slow though, and only needed if there is a backslash.
+    return match.expand(rawdata) if "\\" in rawdata else rawdata
+
+def _wikitable_title(snip: str):
+    """
+    Finds a wikitable's title, the text after "|+ " on a line followed by a line starting
+    with "|". This is what the pattern r"\|\+ (.*?)\n\|" used to find, but a line full of
+    "|+ " no longer gets rescanned once for each of them.
+
+    ## Returns
+    the title, or None if the table has none.
+    """
+    lines = snip.split("\n")
+    for index, line in enumerate(lines[:-1]):
+        if "|+ " in line and lines[index+1].startswith("|"):
+            return line[line.index("|+ ")+3:]
+    return None
 
-def deformat_quotes(wikitext: str) -> str:
+def deformat_quotes(wikitext: str, deadline: float = None) -> str:
     """
     Given a block of wikitext containing a quote object: strip away the formatting
     and return the text with the quoted text and source as plain text. Also works
     on notice boxes.
 
     ## Parameters
-    wikitext: a block of text with MediaWiki formatting, containing one or more quote objects
+    wikitext: a block of text with MediaWiki formatting, containing one or more quote objects    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.
     ## Returns
     a block of text with raw quote text
     """
-    # These regex patterns required a bunch of Stack Overflow dumpster diving to figure out.
-    # See the string under the file docstring.
-    # I only remembered to save some threads, so others are lost to my forgetfulness.
-    noticebox_pattern = r"(?s){{Notice(.*?) \| header =[\n]{0,1}(.*?)\n \| text = (.*?)[\n]{0,1}}}"
-    quotes_pattern = r"(?s){{Quote(.*?)\| quote =[ \n]{0,1}(.*?)\n \| speaker = (.*?)\n \| source =[ ]{0,1}\n}}"
     newtext = wikitext
-    patterns_replacements = {
-        quotes_pattern: r"\2\n\3\n\n",
-        noticebox_pattern: r"\2\n\3\n\n",
-    }
-    for pattern, replacement in patterns_replacements.items():
-        #print(pattern, replacement)
-        while re.search(pattern, newtext):
-            #print("Found a noticebox or quote")
-            #print(re.search(pattern, newtext))
-            newtext = re.sub(pattern, replacement, newtext, count=1)
+    for pattern in [QUOTES_PATTERN, NOTICEBOX_PATTERN]:
+        newtext = sub_until_stable(pattern, QUOTES_REPLACEMENT, newtext, deadline=deadline)
     return newtext
 
-def deformat_links(wikitext: str) -> str:
+def deformat_links(wikitext: str, deadline: float = None) -> str:
     """
     Given a block of wikitext containing links of various forms: strip away their formatting
     and return the text with the link embed phrase(s) instead of the links themselves.
 
     ## Parameters
-    wikitext: a block of text with MediaWiki formatting, containing one or more links
+    wikitext: a block of text with MediaWiki formatting, containing one or more links    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.
     ## Returns
     a block of text with the link embed text in place of the links.
     """
-    external_link_pattern = r"\[http[s]{0,1}:.*? (.{1,}?)\]"
-    internal_link_pattern = r"\[\[([^:|]*?)\]\]"
-    internal_link_displaytext_pattern = r"\[\[.*?\|(.*?)\]\]"
-    categories_link_pattern = r"\[\[Category:.*?\]\]"
-    file_link_pattern = r"\[\[File:(.*?)\]\]"
-
     newtext = wikitext
     # delete category and file links altogether
-    for regex_pattern in [categories_link_pattern, file_link_pattern]:
-        while re.search(regex_pattern, newtext):
-            newtext = re.sub(regex_pattern, "", newtext, count=1)
+    for regex_pattern in [CATEGORIES_LINK_PATTERN, FILE_LINK_PATTERN]:
+        newtext = sub_until_stable(regex_pattern, "", newtext, deadline=deadline)
 
-    for regex_pattern in [external_link_pattern, internal_link_pattern,
-                          internal_link_displaytext_pattern]:
+    for regex_pattern in [EXTERNAL_LINK_PATTERN, INTERNAL_LINK_PATTERN,
+                          INTERNAL_LINK_DISPLAYTEXT_PATTERN]:
         # Find each type of link, then replace them with the raw text within
-        #print(regex_pattern)
-        while re.search(regex_pattern, newtext): # only if such a link exists in the text
-            newtext = re.sub(regex_pattern, r"\1", newtext, count=1)
+        newtext = sub_until_stable(regex_pattern, r"\1", newtext, deadline=deadline)
 
     return newtext
 
-def deformat_infobox_entity(wikitext: str) -> str:
+def deformat_infobox_entity(wikitext: str, deadline: float = None) -> str:
     """
     Given a block of wikitext containing an Infobox entity: strip away the formatting
     and return the text with the Infobox replaced by its raw data.
     
     ## Parameters
-    wikitext: a block of text with MediaWiki formatting, containing an Infobox.
+    wikitext: a block of text with MediaWiki formatting, containing an Infobox.    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.
     ## Returns
     a block of text with the Infobox replace with raw data.
     """
-    newtext = wikitext
-    badlist = ["test", "placeholder", ""]
-    xib_param_pattern = r"(?s)(data|header|label|ddata1|ddata2) =[ ]{0,1}(.*?)( \||}})"
-    #mypattern2 = r"{{xib_param[=a-zA-Z 0-9\n'<br>\|&;:,]*}}"
-    infobox_pattern = r"(?s){{Infobox entity\n(.*?)}}\n}}"
-
     # each Infobox contains a number of smaller xib_param boxes
     # this pulls the raw data from each and every such box
-    # one at a time so as to not cross contaminate
-    while re.search(infobox_pattern, newtext):
-        start, end = re.search(infobox_pattern, newtext).span()
-        snip = newtext[start:end]
-
-        xibs = re.findall(xib_param_pattern, snip)
-        #print(rowsheads)
-
-        rawdata = ""
-        for xib in xibs:
-            #print(row)
-            if len(xib) >= 2 and xib[1] not in ["", "\n"] and xib[1].strip("\n") not in badlist:
-                rawdata += xib[1].strip("\n")
-                rawdata += "\n\n"
-
-        newtext = re.sub(infobox_pattern, rawdata, newtext, count=1)
-    return newtext
+    # one Infobox at a time so as to not cross contaminate
+    return sub_until_stable(INFOBOX_PATTERN, _infobox_rawdata, wikitext, deadline=deadline)
+
+def _infobox_rawdata(match: re.Match) -> str:
+    """
+    Replacement function for deformat_infobox_entity(): pulls the raw data out of every
+    xib_param box of one matched Infobox.
+    """
+    #mypattern2 = r"{{xib_param[=a-zA-Z 0-9\n'<br>\|&;:,]*}}"
+    xibs = XIB_PARAM_PATTERN.findall(match.group(0))
+
+    rawdata = ""
+    for xib in xibs:
+        #print(row)
+        if len(xib) >= 2 and xib[1] not in ["", "\n"] and xib[1].strip("\n") not in INFOBOX_BADLIST:
+            rawdata += xib[1].strip("\n")
+            rawdata += "\n\n"
+    # see _wikitable_rawdata() on expand()
+    return match.expand(rawdata) if "\\" in rawdata else rawdata
+
+def _bracket_pairs(text: str, pattern: re.Pattern, opener: str) -> dict[int, int]:
+    """
+    Pairs up opening and closing brackets ("{{" and "}}", ...) with a stack, so that
+    nested markup closes where it actually ends instead of at the first closing bracket.
+
+    ## Parameters
+    text: the text to scan.    
+    pattern: a pattern matching either bracket.    
+    opener: the opening bracket.
+    ## Returns
+    a dict of opening bracket position -> position right after its closing bracket.
+    Unclosed brackets are left out.
+    """
+    pairs = {}
+    stack = []
+    for bracket in pattern.finditer(text):
+        if bracket.group() == opener:
+            stack.append(bracket.start())
+        elif stack:
+            pairs[stack.pop()] = bracket.end()
+    return pairs
+
+def _find_after(wikitext: str, marker: str, start: int, found: dict) -> int:
+    """
+    str.find() that remembers where it last found each marker, so looking for the same
+    marker from positions moving left to right scans the text only once overall.
+    """
+    searched_from, position = found.get(marker, (len(wikitext) + 1, -1))
+    if not searched_from <= start <= (position if position != -1 else len(wikitext)):
+        position = wikitext.find(marker, start)
+        found[marker] = (start, position)
+    return position
+
+def _template_fits(wikitext: str, start: int, end: int, found: dict) -> bool:
+    """
+    Checks with a few find() calls whether QUOTES_PATTERN/NOTICEBOX_PATTERN can fullmatch the
+    template between start and end. Their lazy groups make a failing fullmatch backtrack
+    through every combination of separators, so it is only run when it will succeed.
+    """
+    if wikitext.startswith("{{Quote", start):
+        quote = _find_after(wikitext, "| quote =", start + len("{{Quote"), found)
+        if quote == -1:
+            return False
+        speaker = _find_after(wikitext, "\n | speaker = ", quote + len("| quote ="), found)
+        for ending in ["\n | source =\n}}", "\n | source = \n}}"]:
+            if wikitext.endswith(ending, start, end):
+                return speaker != -1 and speaker + len("\n | speaker = ") <= end - len(ending)
+        return False
+    header = _find_after(wikitext, " | header =", start + len("{{Notice"), found)
+    if header == -1:
+        return False
+    text = _find_after(wikitext, "\n | text = ", header + len(" | header ="), found)
+    return text != -1 and text + len("\n | text = ") <= end - len("}}")
+
+def _clean_template(wikitext: str, start: int, end: int, deadline: float, depth: int,
+                    found: dict):
+    """
+    Cleans the template between start and end if it is an Infobox entity, a quote or a
+    notice box, laid out the same way as deformat_infobox_entity() and deformat_quotes() do.
+
+    ## Returns
+    the cleaned text, or None if this is some other template.
+    """
+    if wikitext.startswith("{{Infobox entity\n", start):
+        if wikitext.endswith("}}\n}}", start, end) and \
+                end - start >= len("{{Infobox entity\n}}\n}}"):
+            match = INFOBOX_PATTERN.fullmatch(wikitext, start, end)
+            return _clean_nested(_infobox_rawdata(match), deadline, depth)
+    for opening, pattern in [("{{Quote", QUOTES_PATTERN), ("{{Notice", NOTICEBOX_PATTERN)]:
+        if wikitext.startswith(opening, start) and _template_fits(wikitext, start, end, found):
+            match = pattern.fullmatch(wikitext, start, end)
+            return _clean_nested(match.expand(QUOTES_REPLACEMENT), deadline, depth)
+    return None
+
+def _clean_link(wikitext: str, start: int, end: int, deadline: float, depth: int):
+    """
+    Cleans the internal link between start and end the same way deformat_links() does:
+    category and file links disappear, piped links become their display text and plain
+    links become their target.
+
+    ## Returns
+    the cleaned text, or None if the link is left as is (a namespaced link with no
+    display text, e.g. [[User:Someone]]).
+    """
+    inner = wikitext[start+2:end-2]
+    if inner.startswith(("Category:", "File:")):
+        return ""
+    if "|" in inner:
+        return _clean_nested(inner.split("|", 1)[1], deadline, depth)
+    if ":" not in inner:
+        return _clean_nested(inner, deadline, depth)
+    return None
+
+def _clean_nested(wikitext: str, deadline: float, depth: int) -> str:
+    """
+    Cleans the contents of a template, table or link found at the given nesting depth,
+    or just cheap_strip()s them if the markup is nested deeper than MAX_NESTING_DEPTH.
+    """
+    if depth >= MAX_NESTING_DEPTH:
+        return cheap_strip(wikitext)
+    return tokenize_wikitext(wikitext, deadline, depth + 1)
+
+def tokenize_wikitext(wikitext: str, deadline: float = None, depth: int = 0) -> str:
+    """
+    Strips the wikitext formatting from a block of text in a single left-to-right scan:
+    Infoboxes, quotes, notice boxes, wikitables, links, headings, bold/italics and the
+    other bits deformat_misc() handles are each cleaned as soon as the scan reaches them,
+    and the text between them is copied straight to the output.
+
+    Templates, tables and links close at their matching bracket, so nested markup
+    (a link inside a file caption, a template inside a notice, ...) is cleaned as a whole.
+    Other than that the output is the same as running the deformat_* functions one after
+    the other; cleaner_validation.py compares the two on the scraped pages.
+    HTML is left in place for deformat_cycle() to remove.
+
+    No pattern here is tried in a way that can rescan the text over and over, so the time
+    taken grows linearly with the text (times the nesting depth, which is capped at
+    MAX_NESTING_DEPTH), however broken the markup.
+
+    ## Parameters
+    wikitext: a block of text with MediaWiki formatting.    
+    deadline: a time.perf_counter() time to give up at by raising TimeoutError.    
+    depth: how deeply nested this text is, when cleaning the contents of other markup.
+    ## Returns
+    the text without wikitext formatting.
+    """
+    output = []
+    pairs = {} # bracket pairs, only worked out once a bracket of that kind shows up
+    no_match_until = {} # token -> end of the line it can no longer match on
+    found = {} # see _find_after()
+    pos = 0
+    while True:
+        _check_deadline(deadline)
+        token = TOKEN_PATTERN.search(wikitext, pos)
+        if token is None:
+            output.append(wikitext[pos:])
+            break
+        start = token.start()
+        output.append(wikitext[pos:start])
+        pos = token.end()
+        kind = token.group()
+        cleaned = None
+
+        if kind in ("{{", "{|", "[["):
+            simple_link = SIMPLE_LINK_PATTERN.match(wikitext, start) if kind == "[[" else None
+            if simple_link:
+                # most links have no brackets inside, so their end is already known
+                end = simple_link.end()
+            else:
+                if kind not in pairs:
+                    pattern = {"{{": TEMPLATE_BRACKETS_PATTERN, "{|": TABLE_BRACKETS_PATTERN,
+                               "[[": LINK_BRACKETS_PATTERN}[kind]
+                    pairs[kind] = _bracket_pairs(wikitext, pattern, kind)
+                end = pairs[kind].get(start)
+            if end is not None:
+                if kind == "{{":
+                    cleaned = _clean_template(wikitext, start, end, deadline, depth, found)
+                elif kind == "[[":
+                    cleaned = _clean_link(wikitext, start, end, deadline, depth)
+                elif wikitext.startswith("{| class=\"wikitable", start):
+                    match = WIKITABLE_PATTERN.fullmatch(wikitext, start, end)
+                    if match:
+                        cleaned = _clean_nested(_wikitable_rawdata(match), deadline, depth)
+            if cleaned is not None:
+                pos = end
+        elif kind[0] == "'":
+            # bold is removed before italics, so a run can only ever leave a lone '
+            cleaned = "'" if len(kind) % 3 == 1 else ""
+        elif kind[0] == "-":
+            cleaned = "-" * (len(kind) % 4)
+        elif kind == "<br>":
+            cleaned = " "
+        elif kind == "<hr>":
+            cleaned = "----"
+        elif start >= no_match_until.get(kind[:2], -1):
+            # headings, collapsibles and external links can't span lines, and if one
+            # doesn't match then no later one on the same line can either
+            if kind[0] == "=":
+                pattern, group = HEADING_PATTERN, 1
+            elif kind[0] == "<":
+                pattern, group = COLLAPSIBLE_PATTERN, 2
+            else:
+                pattern, group = EXTERNAL_LINK_TOKEN_PATTERN, 1
+            match = pattern.match(wikitext, start)
+            if match:
+                cleaned = _clean_nested(match.group(group), deadline, depth)
+                if kind[0] == "<":
+                    cleaned = "Collapsible Section: " + cleaned
+                pos = match.end()
+            else:
+                line_end = wikitext.find("\n", start)
+                no_match_until[kind[:2]] = line_end if line_end != -1 else len(wikitext)
+
+        output.append(kind if cleaned is None else cleaned)
+    return "".join(output)
@@ -0,0 +1,274 @@
+"""
+Contains the revision store: the revisions dataset kept as append-only Parquet files,
+partitioned by month, instead of one CSV that is read, extended and rewritten in full on
+every update.
+
+datasets/revision_store/ holds one folder per month of revision timestamps
+(month=2025-05/), and every upsert adds a new part file to the months it touches; no part
+file is ever rewritten. Each month folder has its own index.json, mapping the revision IDs
+of that month to the part holding their current row and a hash of that row, so telling
+whether a revision is new, unchanged or changed is a dict lookup instead of a scan over the
+whole history, and an upsert only rewrites the indexes of the months it touches. A revision
+that changed gets its new row appended, and the index points at it from then on;
+load_revisions() keeps only the rows the indexes point at. store.json only holds the number
+of the next part file and the newest timestamp stored.
+
+Part numbers are reserved in store.json first, then the part files and then the month
+indexes are written, all atomically, so a crash in between only leaves part files that
+nothing points at and that load_revisions() ignores.
+
+A full rebuild (datasets_creation.produce_revs_df()) replaces the store instead of upserting
+into it, so revisions the rebuild no longer returns (deleted, or outside the categories now)
+are dropped. The new store is written next to the old one and swapped in with two renames;
+load_meta() finishes or rolls back a swap that a crash interrupted.
+
+The store needs pyarrow. revisions_df.csv and the Excel sheets are export views of it, see
+dataset_export.py.
+"""
+import os
+import json
+import shutil
+import importlib.util
+from typing import TYPE_CHECKING
+import page_files
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+REVISION_STORE_PATH = "datasets/revision_store/"
+REPLACEMENT_STORE_PATH = "datasets/revision_store.new/" # built here, then swapped in
+OLD_STORE_PATH = "datasets/revision_store.old/" # the replaced store, until the swap is done
+STORE_META_FILENAME = "store.json"
+PARTITION_INDEX_FILENAME = "index.json"
+REVISION_KEY = "Revision ID"
+PARTITION_COLUMN = "Timestamp" # partitioned by the month of this column
+
+_store_meta = None # see load_meta()
+_partition_indexes = {} # month -> that month's index, see load_partition_index()
+_revision_months = None # revision ID -> month of every stored revision, see _months_by_revid()
+
+def _require_pyarrow():
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError("The revision store needs pyarrow for its Parquet files "
+                          "(pip install pyarrow)")
+
+def load_meta(refresh: bool = False) -> dict:
+    """
+    Returns the store-wide bookkeeping, reading it from disk on first use.
+
+    ## Parameters
+    refresh: default False; read it from disk again (and forget the loaded month indexes).
+    ## Returns
+    a dict with next_part (the number of the next part file) and latest_timestamp (the
+    newest revision timestamp stored, or None).
+    """
+    global _store_meta, _revision_months
+    if _store_meta is None or refresh:
+        _finish_interrupted_replace()
+        _partition_indexes.clear()
+        _revision_months = None
+        path = REVISION_STORE_PATH + STORE_META_FILENAME
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                _store_meta = json.load(f)
+        else:
+            _store_meta = {"next_part": 0, "latest_timestamp": None}
+    return _store_meta
+
+def partition_months() -> list[str]:
+    """
+    Returns the months the store has partitions for, oldest first ("2025-05").
+    """
+    load_meta()
+    if not os.path.isdir(REVISION_STORE_PATH):
+        return []
+    return sorted(name.removeprefix("month=") for name in os.listdir(REVISION_STORE_PATH)
+                  if name.startswith("month="))
+
+def load_partition_index(month: str) -> dict:
+    """
+    Returns the index of one month, reading it from disk on first use.
+
+    ## Parameters
+    month: the month, e.g. "2025-05".
+    ## Returns
+    revision ID -> [part file name, row hash] for the revisions of that month.
+    """
+    load_meta()
+    if month not in _partition_indexes:
+        path = f"{REVISION_STORE_PATH}month={month}/{PARTITION_INDEX_FILENAME}"
+        index = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                index = {int(revid): entry for revid, entry in json.load(f).items()}
+        _partition_indexes[month] = index
+    return _partition_indexes[month]
+
+def _save_json(path: str, data: dict):
+    page_files.write_text_atomic(path, json.dumps(data, sort_keys=True))
+
+def _finish_interrupted_replace():
+    if os.path.isdir(REVISION_STORE_PATH):
+        # either the swap went through or it never started; a half built store is useless
+        shutil.rmtree(REPLACEMENT_STORE_PATH, ignore_errors=True)
+        shutil.rmtree(OLD_STORE_PATH, ignore_errors=True)
+    elif os.path.isdir(OLD_STORE_PATH):
+        # crashed between the two renames: the old store is still whole, put it back
+        os.replace(OLD_STORE_PATH.rstrip("/"), REVISION_STORE_PATH.rstrip("/"))
+        shutil.rmtree(REPLACEMENT_STORE_PATH, ignore_errors=True)
+
+def _months_by_revid() -> dict:
+    """
+    Returns revision ID -> month for every stored revision, reading all the month indexes
+    on first use. Upserts keep it up to date, so lookups never go back to the disk.
+    """
+    global _revision_months
+    load_meta()
+    if _revision_months is None:
+        _revision_months = {}
+        for month in partition_months():
+            _revision_months.update(dict.fromkeys(load_partition_index(month), month))
+    return _revision_months
+
+def contains(revid: int) -> bool:
+    """
+    Returns whether a revision is already in the store.
+    """
+    return int(revid) in _months_by_revid()
+
+def is_empty() -> bool:
+    """
+    Returns whether the store holds no revisions yet.
+    """
+    return not _months_by_revid()
+
+def row_hashes(revs_df: "pd.DataFrame") -> list[str]:
+    """
+    Returns a hash of every row of a revisions frame, to tell changed rows from unchanged
+    ones. Only the values count, not the index, the column order or the datetime unit.
+    """
+    import pandas as pd
+    canonical = revs_df[sorted(revs_df.columns)].copy()
+    for column in canonical.columns:
+        if pd.api.types.is_datetime64_any_dtype(canonical[column]):
+            canonical[column] = canonical[column].astype("datetime64[ns]")
+    return [f"{value:016x}" for value in pd.util.hash_pandas_object(canonical, index=False)]
+
+def upsert_revisions(revs_df: "pd.DataFrame", replace: bool = False) -> int:
+    """
+    Adds revisions to the store. Rows already stored with the same values are skipped, so
+    upserting the same rows again changes nothing; rows whose values changed replace the
+    stored ones.
+
+    ## Parameters
+    revs_df: revisions with the REVISIONS_COLUMNS of pandas_df_funcs.    
+    replace: default False; revs_df is the whole dataset (a full rebuild), so the store is
+    rewritten to hold exactly these rows and any revision not among them is dropped.    
+    ## Returns
+    how many rows were written.
+    """
+    _require_pyarrow()
+    global _store_meta, _revision_months
+    revs_df = revs_df.drop_duplicates(REVISION_KEY, keep="last").reset_index(drop=True)
+    hashes = row_hashes(revs_df)
+    months = revs_df[PARTITION_COLUMN].dt.strftime("%Y-%m")
+    if replace:
+        old_revids = set(_months_by_revid())
+        shutil.rmtree(REPLACEMENT_STORE_PATH, ignore_errors=True)
+        meta = {"next_part": 0, "latest_timestamp": None}
+        indexes = {month: {} for month in set(months)}
+        written = _write_parts(revs_df, months, hashes, meta, indexes, REPLACEMENT_STORE_PATH)
+        if os.path.isdir(REVISION_STORE_PATH):
+            os.replace(REVISION_STORE_PATH.rstrip("/"), OLD_STORE_PATH.rstrip("/"))
+        os.replace(REPLACEMENT_STORE_PATH.rstrip("/"), REVISION_STORE_PATH.rstrip("/"))
+        shutil.rmtree(OLD_STORE_PATH, ignore_errors=True)
+        _store_meta = meta
+        _partition_indexes.clear()
+        _partition_indexes.update(indexes)
+        _revision_months = dict(zip(revs_df[REVISION_KEY].astype(int).tolist(), months))
+        dropped = len(old_revids.difference(*indexes.values()))
+        print(f"Replaced the revision store, dropping {dropped} revisions the rebuild "
+              "did not return")
+        return written
+    keep = [load_partition_index(month).get(int(revid), [None, None])[1] != row_hash
+            for revid, month, row_hash in zip(revs_df[REVISION_KEY], months, hashes)]
+    if not any(keep):
+        return 0
+    new_rows = revs_df[keep]
+    new_months = months[keep]
+    indexes = {month: load_partition_index(month) for month in set(new_months)}
+    new_hashes = [row_hash for row_hash, kept in zip(hashes, keep) if kept]
+    revision_months = _months_by_revid()
+    written = _write_parts(new_rows, new_months, new_hashes, load_meta(), indexes,
+                           REVISION_STORE_PATH)
+    revision_months.update(zip(new_rows[REVISION_KEY].astype(int).tolist(), new_months))
+    return written
+
+def _write_parts(new_rows: "pd.DataFrame", months: "pd.Series", new_hashes: list[str],
+                 meta: dict, indexes: dict, store_path: str) -> int:
+    """
+    Writes rows into new part files under store_path, one per month, then points the month
+    indexes at them and saves the indexes of those months only.
+
+    ## Returns
+    how many rows were written.
+    """
+    groups = list(new_rows.groupby(months, sort=True))
+    first_part = meta["next_part"]
+    meta["next_part"] += len(groups)
+    os.makedirs(store_path, exist_ok=True)
+    # reserved before any part is written, so a crash never hands the same number out twice
+    _save_json(store_path + STORE_META_FILENAME, meta)
+    part_names = {}
+    for number, (month, month_rows) in enumerate(groups, start=first_part):
+        folder = f"{store_path}month={month}/"
+        os.makedirs(folder, exist_ok=True)
+        part_names[month] = f"part-{number:06d}.parquet"
+        temp_path = folder + part_names[month] + ".tmp"
+        month_rows.to_parquet(temp_path, index=False)
+        os.replace(temp_path, folder + part_names[month])
+    for revid, month, row_hash in zip(new_rows[REVISION_KEY], months, new_hashes):
+        indexes[month][int(revid)] = [part_names[month], row_hash]
+    for month in part_names:
+        _save_json(f"{store_path}month={month}/{PARTITION_INDEX_FILENAME}", indexes[month])
+    if not new_rows.empty:
+        latest = new_rows[PARTITION_COLUMN].max().isoformat()
+        if meta["latest_timestamp"] is None or latest > meta["latest_timestamp"]:
+            meta["latest_timestamp"] = latest
+            _save_json(store_path + STORE_META_FILENAME, meta)
+    print(f"Stored {len(new_rows)} revisions in {len(part_names)} new part files")
+    return len(new_rows)
+
+def load_revisions() -> "pd.DataFrame":
+    """
+    Reads the current row of every stored revision.
+
+    ## Returns
+    the revisions dataset, ordered like produce_revs_df() makes it: by page ID, each page's
+    revisions newest first.
+    """
+    import pandas as pd
+    _require_pyarrow()
+    frames = []
+    for month in partition_months():
+        current = {}
+        for revid, (part_name, _) in load_partition_index(month).items():
+            current.setdefault(part_name, set()).add(revid)
+        for part_name in sorted(current):
+            part = pd.read_parquet(f"{REVISION_STORE_PATH}month={month}/{part_name}")
+            frames.append(part[part[REVISION_KEY].isin(current[part_name])])
+    if not frames:
+        return pd.DataFrame()
+    revs_df = pd.concat(frames, ignore_index=True)
+    revs_df = revs_df.sort_values(["Page ID", PARTITION_COLUMN, REVISION_KEY],
+                                  ascending=[True, False, False])
+    return revs_df.reset_index(drop=True)
+
+def latest_timestamp() -> "pd.Timestamp":
+    """
+    Returns the newest revision timestamp in the store (as stored, shifted to EST), or None
+    if the store is empty.
+    """
+    import pandas as pd
+    latest = load_meta()["latest_timestamp"]
+    return None if latest is None else pd.Timestamp(latest)
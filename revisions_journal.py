@@ -0,0 +1,126 @@
+"""
+Runs the full revisions build (see datasets_creation.produce_revs_df()) as a journaled job,
+so a connection failure halfway through (the DNS and empty-response errors noted in
+datasets_creation.py) no longer throws away everything walked so far.
+
+Every revision is appended to a JSON lines journal, and synced to disk, as soon as it has
+been walked. Running the job again picks up where the journal stops: finished pages are
+skipped and a page cut short resumes after its last journaled revision. A page whose walk
+fails is set aside and retried from that revision once the other pages are done. Since the
+dataset is put together from the journal in page order either way, an interrupted and
+resumed build ends up with the same rows, in the same order, as one that ran straight through.
+
+Journal records are one JSON object per line:
+- {"type": "revision", ...}: one walked revision, as yielded by walk_page_revisions().
+- {"type": "page_done", "pageid": ...}: a page's whole history was walked.
+- {"type": "failed", "pageid": ..., "after_revid": ..., "error": ...}: a walk failed after
+that revision (None: before the first one).
+- {"type": "complete"}: every page was walked; the next build starts a new journal.
+"""
+import os
+import json
+import mediawiki_api_calls
+
+REVISIONS_JOURNAL_PATH = "datasets/revisions_journal.jsonl"
+JOURNAL_RETRY_ROUNDS = 2 # extra passes over the pages whose walk failed
+
+def load_journal(path: str = REVISIONS_JOURNAL_PATH) -> list[dict]:
+    """
+    Reads every record of a journal. A last line cut short by a crash is dropped, and cut
+    off the file so that new records start on a line of their own.
+
+    ## Parameters
+    path: the journal file.
+    ## Returns
+    the records in the order they were written, or [] if there is no journal.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            print(f"Dropping a partly written record at the end of {path}")
+            f.truncate(end)
+    return [json.loads(line) for line in data[:end].decode("utf-8").splitlines() if line]
+
+def append_record(journal, record: dict):
+    """
+    Appends one record to an open journal file and syncs it to disk before returning.
+    """
+    journal.write(json.dumps(record) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def _walk_page(journal, pageid: int, page_revisions: list[dict]) -> bool:
+    """
+    Walks a page's history after its last journaled revision, journaling every revision.
+
+    ## Returns
+    whether the walk got to the end of the page's history.
+    """
+    after_revid, prev_words = None, None
+    if page_revisions:
+        after_revid = page_revisions[-1]["revid"]
+        prev_words = page_revisions[-1]["words"]
+    try:
+        for revision in mediawiki_api_calls.walk_page_revisions(pageid, after_revid,
+                                                                prev_words):
+            append_record(journal, dict(revision, type="revision"))
+            page_revisions.append(revision)
+            after_revid = revision["revid"]
+    except Exception as error: # api_get() already retried; set the page aside for now
+        print(f"Walking page {pageid} failed after revision {after_revid}: {error!r}")
+        append_record(journal, {"type": "failed", "pageid": pageid,
+                                "after_revid": after_revid, "error": repr(error)})
+        return False
+    append_record(journal, {"type": "page_done", "pageid": pageid})
+    return True
+
+def run_revisions_job(pageids: list[int], path: str = REVISIONS_JOURNAL_PATH) -> list[dict]:
+    """
+    Walks the revision history of every page, resuming from the journal if a previous run
+    was cut short.
+
+    ## Parameters
+    pageids: the pages to walk, in the order the dataset lists them.
+    path: the journal file.
+    ## Returns
+    every revision dict (see mediawiki_api_calls.walk_page_revisions()), page by page in
+    the order of pageids, each page's revisions newest first.
+    """
+    records = load_journal(path)
+    if records and records[-1]["type"] == "complete":
+        records = [] # the last build finished; this is a new one
+        os.remove(path)
+    revisions = {} # pageid -> revisions walked so far, oldest first
+    done = set()
+    for record in records:
+        if record["type"] == "revision":
+            revision = {key: value for key, value in record.items() if key != "type"}
+            revisions.setdefault(record["pageid"], []).append(revision)
+        elif record["type"] == "page_done":
+            done.add(record["pageid"])
+    if records:
+        print(f"Resuming from {path}: {len(done)} pages done, "
+              f"{sum(len(page) for page in revisions.values())} revisions journaled")
+
+    with open(path, 'a', encoding='utf-8') as journal:
+        pending = [pageid for pageid in pageids if pageid not in done]
+        for attempt in range(JOURNAL_RETRY_ROUNDS + 1):
+            if attempt and pending:
+                print(f"Retrying {len(pending)} pages that failed (round {attempt})")
+            pending = [pageid for pageid in pending
+                       if not _walk_page(journal, pageid, revisions.setdefault(pageid, []))]
+            if not pending:
+                break
+        if pending:
+            raise RuntimeError(f"Could not walk pages {pending}; run again to resume "
+                               f"from {path}")
+        append_record(journal, {"type": "complete"})
+
+    ordered = []
+    for pageid in pageids:
+        # walked oldest first; the dataset lists each page's revisions newest first
+        ordered += reversed(revisions.get(pageid, []))
+    return ordered
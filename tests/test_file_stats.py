@@ -0,0 +1,52 @@
+"""
+Tests that file_stats() counts the same characters and words as reading the whole file
+and counting the text.
+"""
+import random
+import pytest
+import file_stats
+import mediawiki_api_calls
+
+TEXT_SEED = 2024
+# multi-byte characters, and whitespace str.strip() drops but a space split does not
+PIECES = ["word", "é", "→", "𝄞", "漢字", " ", "  ", "\n", "\r\n", "\t", "\xa0", "　",
+          " ", "\x0c"]
+
+def expected_stats(path) -> dict:
+    # newline="" so the characters are counted as they are on disk, "\r\n" as two
+    with open(path, 'r', encoding='utf-8', newline="") as f:
+        text = f.read()
+    words = mediawiki_api_calls.get_wordcount_text(text)
+    return {"path": str(path), "bytes": len(text.encode("utf-8")), "chars": len(text),
+            "words": words, "word_length": len(text) / words}
+
+def generate_text(rng: random.Random) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 60)))
+
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 3, 5, 64, 1 << 20])
+def test_file_stats_matches_reading_the_file(tmp_path, monkeypatch, chunk_bytes):
+    # small chunks split characters and whitespace runs between reads
+    monkeypatch.setattr(file_stats, "STATS_CHUNK_BYTES", chunk_bytes)
+    monkeypatch.setattr(file_stats, "EDGE_BYTES", 4)
+    rng = random.Random(TEXT_SEED)
+    for index in range(200):
+        path = tmp_path / f"page-{index}.txt"
+        path.write_bytes(generate_text(rng).encode("utf-8"))
+        assert file_stats.file_stats(str(path)) == expected_stats(path), path.read_bytes()
+
+@pytest.mark.parametrize("text", ["", " ", "   \n ", "word", " word ", "a b  c",
+                                  "　a b　", "é" * 100])
+def test_file_stats_edge_cases(tmp_path, text):
+    path = tmp_path / "page.txt"
+    path.write_bytes(text.encode("utf-8"))
+    assert file_stats.file_stats(str(path)) == expected_stats(path)
+
+def test_many_file_stats_matches_file_stats(tmp_path):
+    rng = random.Random(TEXT_SEED)
+    paths = []
+    for index in range(20):
+        path = tmp_path / f"page-{index}.txt"
+        path.write_bytes(generate_text(rng).encode("utf-8"))
+        paths.append(str(path))
+    assert file_stats.many_file_stats(paths, workers=2) == \
+        {path: expected_stats(path) for path in paths}
@@ -0,0 +1,38 @@
+"""
+Tests that the "fast" mode of html_stripper.strip_html() returns the same text as
+BeautifulSoup on generated HTML fragments.
+"""
+import random
+import pytest
+import html_stripper
+
+pytest.importorskip("bs4")
+
+FRAGMENT_SEED = 2024
+FRAGMENT_COUNT = 500
+# the kinds of things a cleaned page still has in it, and a few it should not
+PIECES = [
+    "word", "two words", " ", "  ", "\n", "\n\n", "\t", "é", "→",
+    "<div>", "</div>", "<span class=\"x\">", "</span>", "<p>", "</p>", "<b>", "</b>",
+    "<br>", "<br/>", "</br>", "<hr />", "<img src=\"a.png\">",
+    "<pre>", "</pre>", "<textarea>", "</textarea>",
+    "<script>", "</script>", "<style>", "</style>",
+    "&amp;", "&nbsp;", "&lt;", "&gt;", "&quot;", "&copy", "&notit;", "&unknown;", "& ",
+    "&#65;", "&#x41;", "&#X263A;", "&#0;", "&#150;", "&#xd800;", "&#12abc", "&#;",
+    "<!-- a comment -->", "<!DOCTYPE html>", "<![CDATA[kept]]>", "<?pi data?>",
+    "a < b", "a > b", "</>", "<>",
+]
+
+def generate_fragment(rng: random.Random) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(1, 30)))
+
+def test_fast_mode_matches_bs4_on_generated_fragments():
+    rng = random.Random(FRAGMENT_SEED)
+    for _ in range(FRAGMENT_COUNT):
+        fragment = generate_fragment(rng)
+        assert html_stripper.strip_html(fragment, "fast") == \
+            html_stripper.strip_html(fragment, "bs4"), fragment
+
+@pytest.mark.parametrize("text", ["", " ", "\n \n", "plain text", "a & b", "<p>x</p>"])
+def test_fast_mode_matches_bs4_on_edge_cases(text):
+    assert html_stripper.strip_html(text, "fast") == html_stripper.strip_html(text, "bs4")
@@ -0,0 +1,19 @@
+"""
+Runs import_budget.py's check over the project's modules, so a slow or side-effecting
+import fails the test run.
+"""
+import os
+import import_budget
+
+def test_every_module_imports_within_budget(monkeypatch):
+    # the child interpreter imports from the working directory
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(import_budget.__file__)))
+    assert import_budget.check_imports() == []
+
+def test_side_effects_and_errors_are_reported(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "lists_at_import.py").write_text("import os\nos.listdir('.')\n")
+    (tmp_path / "fails_at_import.py").write_text("raise RuntimeError('broken')\n")
+    problems = import_budget.check_imports(["lists_at_import", "fails_at_import"])
+    assert problems == ["importing lists_at_import called os.listdir",
+                        "importing fails_at_import raised RuntimeError('broken')"]
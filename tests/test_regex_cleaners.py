@@ -0,0 +1,73 @@
+"""
+Tests that regex_cleaners.sub_until_stable() gives the same text as the old
+"sub one match, search again" loops it replaced, on generated and broken pages.
+"""
+import random
+import pytest
+import regex_cleaners
+import cleaner_benchmarks
+
+PAGE_SEED = 2025
+PAGE_COUNT = 150
+PAGE_SIZE = 5000
+PAGE_MUTATIONS = 3
+TOKEN_SEED = 7
+TOKEN_COUNT = 3000
+# bits of markup the patterns start, end or nest on
+TOKENS = [
+    "[[", "]]", "[", "]", "|", ":", "a", " ", "\n", "[http://x ", "Category:", "File:",
+    "{{Quote", "| quote =", "\n | speaker = ", "\n | source =\n}}",
+    "{{Notice", " | header =", "\n | text = ", "}}",
+    "{{Infobox entity\n", "data = x |", "}}\n}}",
+    "{| class=\"wikitable\"", "\n| a\n", "|}",
+]
+
+
+def baseline_sub(pattern, replacement, text, opener=None, deadline=None):
+    # the loop the cleaners used before sub_until_stable()
+    while pattern.search(text):
+        text = pattern.sub(replacement, text, count=1)
+    return text
+
+
+def _replacement(pattern):
+    if pattern is regex_cleaners.WIKITABLE_PATTERN:
+        return regex_cleaners._wikitable_rawdata
+    if pattern is regex_cleaners.INFOBOX_PATTERN:
+        return regex_cleaners._infobox_rawdata
+    if pattern in (regex_cleaners.QUOTES_PATTERN, regex_cleaners.NOTICEBOX_PATTERN):
+        return regex_cleaners.QUOTES_REPLACEMENT
+    if pattern in (regex_cleaners.CATEGORIES_LINK_PATTERN, regex_cleaners.FILE_LINK_PATTERN):
+        return ""
+    return r"\1"
+
+
+@pytest.mark.parametrize("wikitext, expected", [
+    ("[[[[]]a[[]]", "[[a"),
+    ("[[[[a]]b]]", "ab"),
+    ("[http://x [http://x ]][http://x ]]", "][http://x ]"),
+])
+def test_nested_links(wikitext, expected):
+    assert regex_cleaners.deformat_links(wikitext) == expected
+
+
+def test_matches_baseline_on_tokens():
+    rng = random.Random(TOKEN_SEED)
+    for _ in range(TOKEN_COUNT):
+        text = "".join(rng.choice(TOKENS) for _ in range(rng.randint(1, 25)))
+        for pattern in regex_cleaners.PATTERN_OPENERS:
+            replacement = _replacement(pattern)
+            assert regex_cleaners.sub_until_stable(pattern, replacement, text) == \
+                baseline_sub(pattern, replacement, text), (pattern.pattern, text)
+
+
+def test_matches_baseline_on_mutated_pages(monkeypatch):
+    rng = random.Random(PAGE_SEED)
+    for index in range(PAGE_COUNT):
+        wikitext = cleaner_benchmarks.generate_wikitext(PAGE_SIZE, PAGE_SEED + index)
+        wikitext = cleaner_benchmarks.mutate_wikitext(wikitext, rng, PAGE_MUTATIONS)
+        cleaned = regex_cleaners.deformat_cycle_regex(wikitext)
+        with monkeypatch.context() as patched:
+            patched.setattr(regex_cleaners, "sub_until_stable", baseline_sub)
+            expected = regex_cleaners.deformat_cycle_regex(wikitext)
+        assert cleaned == expected, index
@@ -0,0 +1,51 @@
+"""
+Tests for the revision lookups of revision_store.py, on a store in a temporary folder.
+"""
+import pytest
+
+pytest.importorskip("pyarrow")
+pd = pytest.importorskip("pandas")
+import revision_store
+
+
+def revisions(revids, timestamp="2025-05-03"):
+    return pd.DataFrame({
+        "Revision ID": revids,
+        "Page ID": [1] * len(revids),
+        "Timestamp": pd.to_datetime([timestamp] * len(revids)),
+        "Size": [5] * len(revids),
+    })
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    revision_store.load_meta(refresh=True)
+    yield revision_store
+    revision_store.load_meta(refresh=True)
+
+
+def test_upserts_update_the_lookup(store):
+    assert store.is_empty()
+    store.upsert_revisions(revisions([1, 2]))
+    store.upsert_revisions(revisions([3], "2025-06-01"))
+    assert not store.is_empty()
+    assert all(store.contains(revid) for revid in (1, 2, 3))
+    assert not store.contains(4)
+
+
+def test_lookup_reads_the_month_indexes_once(store, monkeypatch):
+    store.upsert_revisions(revisions([1, 2]))
+    store.upsert_revisions(revisions([3], "2025-06-01"))
+    store.load_meta(refresh=True)
+    assert store.contains(3)
+    monkeypatch.setattr(store, "partition_months", lambda: pytest.fail("read the disk again"))
+    assert store.contains(1) and not store.contains(4)
+
+
+def test_replace_drops_missing_revisions(store):
+    store.upsert_revisions(revisions([1, 2]))
+    store.upsert_revisions(revisions([2, 5], "2025-07-01"), replace=True)
+    assert not store.contains(1) and store.contains(5)
+    store.load_meta(refresh=True)
+    assert not store.contains(1) and store.contains(5)
@@ -0,0 +1,94 @@
+"""
+Tests for revisions_journal.py, with walk_page_revisions() replaced by a fake page history
+so no API calls are made.
+"""
+import json
+import pytest
+import mediawiki_api_calls
+import revisions_journal
+
+# pageid -> revision IDs, oldest first
+HISTORIES = {1: [10, 11, 12], 2: [20, 21, 22, 23], 3: [30]}
+
+class FakeWalker:
+    """
+    Stands in for walk_page_revisions(). fail_after maps a page ID to a list of revision
+    counts: each walk of that page takes the next count and raises after yielding that many
+    revisions, until the list runs out.
+    """
+    def __init__(self, fail_after: dict = None, error: type = ConnectionError):
+        self.fail_after = {pageid: list(counts) for pageid, counts in (fail_after or {}).items()}
+        self.error = error
+        self.calls = []
+
+    def __call__(self, pageid, after_revid=None, prev_words=None):
+        self.calls.append((pageid, after_revid))
+        history = HISTORIES[pageid]
+        start = history.index(after_revid) + 1 if after_revid is not None else 0
+        words = prev_words if after_revid is not None else 1
+        counts = self.fail_after.get(pageid)
+        fail_at = counts.pop(0) if counts else None
+        for yielded, revid in enumerate(history[start:]):
+            if yielded == fail_at:
+                raise self.error(f"lost the connection walking page {pageid}")
+            new_words = words + revid
+            yield {"revid": revid, "parentid": 0, "pageid": pageid, "words": new_words,
+                   "worddiff": new_words - words}
+            words = new_words
+
+def run_job(monkeypatch, journal_path, walker):
+    monkeypatch.setattr(mediawiki_api_calls, "walk_page_revisions", walker)
+    return revisions_journal.run_revisions_job(list(HISTORIES), str(journal_path))
+
+@pytest.fixture
+def clean_run(tmp_path, monkeypatch):
+    return run_job(monkeypatch, tmp_path / "clean.jsonl", FakeWalker())
+
+def test_clean_run_lists_pages_in_order_newest_first(clean_run):
+    assert [revision["revid"] for revision in clean_run] == [12, 11, 10, 23, 22, 21, 20, 30]
+
+def test_load_journal_drops_and_truncates_a_torn_last_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    path.write_text('{"type": "page_done", "pageid": 1}\n{"type": "revis', encoding="utf-8")
+    assert revisions_journal.load_journal(str(path)) == [{"type": "page_done", "pageid": 1}]
+    assert path.read_text(encoding="utf-8") == '{"type": "page_done", "pageid": 1}\n'
+
+def test_resume_after_a_crash_and_a_torn_line_matches_a_clean_run(tmp_path, monkeypatch,
+                                                                   clean_run):
+    path = tmp_path / "journal.jsonl"
+    # a crash (not an API error, which the job catches) partway through page 2
+    with pytest.raises(KeyboardInterrupt):
+        run_job(monkeypatch, path, FakeWalker({2: [2]}, error=KeyboardInterrupt))
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "revision", "revid": 22, "pag')
+    walker = FakeWalker()
+    assert run_job(monkeypatch, path, walker) == clean_run
+    # page 1 was done, page 2 picks up after its last journaled revision
+    assert walker.calls == [(2, 21), (3, None)]
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert records[-1] == {"type": "complete"}
+
+def test_failed_pages_are_retried_within_the_same_run(tmp_path, monkeypatch, clean_run):
+    failures = [1] * revisions_journal.JOURNAL_RETRY_ROUNDS
+    walker = FakeWalker({2: failures})
+    assert run_job(monkeypatch, tmp_path / "journal.jsonl", walker) == clean_run
+    # every round gets one revision further, and resumes after it
+    resumed_after = [None] + HISTORIES[2][:revisions_journal.JOURNAL_RETRY_ROUNDS]
+    assert walker.calls == [(1, None)] + [(2, revid) for revid in resumed_after[:1]] + \
+        [(3, None)] + [(2, revid) for revid in resumed_after[1:]]
+
+def test_pages_failing_every_round_resume_on_the_next_run(tmp_path, monkeypatch, clean_run):
+    path = tmp_path / "journal.jsonl"
+    failures = [0] * (revisions_journal.JOURNAL_RETRY_ROUNDS + 1)
+    with pytest.raises(RuntimeError, match=r"\[3\]"):
+        run_job(monkeypatch, path, FakeWalker({3: failures}))
+    walker = FakeWalker()
+    assert run_job(monkeypatch, path, walker) == clean_run
+    assert walker.calls == [(3, None)]
+
+def test_a_complete_journal_starts_a_new_build(tmp_path, monkeypatch, clean_run):
+    path = tmp_path / "journal.jsonl"
+    run_job(monkeypatch, path, FakeWalker())
+    walker = FakeWalker()
+    assert run_job(monkeypatch, path, walker) == clean_run
+    assert [pageid for pageid, _ in walker.calls] == list(HISTORIES)
@@ -0,0 +1,42 @@
+"""
+Tests that text_cache.py keeps the access times of reads without writing them on every read.
+"""
+import time
+import sqlite3
+import pytest
+import text_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    text_cache.close()
+    monkeypatch.setattr(text_cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    yield text_cache
+    text_cache.close()
+
+
+def last_access(key) -> float:
+    with sqlite3.connect(text_cache.CACHE_PATH) as connection:
+        return connection.execute("SELECT last_access FROM entries WHERE key = ?",
+                                  (str(key),)).fetchone()[0]
+
+
+def test_reads_are_written_on_close(cache):
+    cache.cache_put("wikitext", 1, "text")
+    stored = last_access(1)
+    time.sleep(0.01)
+    assert cache.cache_get("wikitext", 1) == "text"
+    assert last_access(1) == stored
+    cache.close()
+    assert last_access(1) > stored
+    assert cache.cache_get("wikitext", 1) == "text"
+
+
+def test_eviction_keeps_recently_read_entries(cache):
+    for key in range(4):
+        cache.cache_put("wikitext", key, f"text {key}")
+    cache.cache_get("wikitext", 0)
+    size = cache.cache_size()
+    cache.evict(size // 2)
+    assert cache.cache_get("wikitext", 0) == "text 0"
+    assert cache.cache_get("wikitext", 1) is None
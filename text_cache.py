@@ -0,0 +1,173 @@
+"""
+Contains a persistent on-disk cache for text that never changes once written, such as the
+wikitext of a given revision ID. MediaWiki never edits a revision in place, so anything
+stored under a revision ID is valid forever and only needs to be downloaded once.
+
+Entries live in a single SQLite file, grouped by a namespace ("wikitext", ...) and
+compressed with zlib. Once the cache grows past CACHE_MAX_BYTES, the least recently used
+entries are deleted until it fits again. Reads don't write to the file: the time of each
+read is kept in memory and written along with the next put, eviction or close().
+"""
+import os
+import atexit
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Optional
+
+CACHE_PATH = "cache/text_cache.sqlite3"
+CACHE_MAX_BYTES = 512 * 1024 * 1024 # compressed bytes kept on disk before evicting
+COMPRESSION_LEVEL = 6
+TOUCH_FLUSH_LIMIT = 1000 # reads remembered before their access times are written anyway
+
+_connection = None
+_total_bytes = 0
+_lock = threading.Lock() # the connection is shared by the API fetching threads
+_pending_touches = {} # (namespace, key) -> last access time not written yet
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Opens the cache file on first use, creating it and its table if necessary.
+    """
+    global _connection, _total_bytes
+    if _connection is None:
+        folder = os.path.dirname(CACHE_PATH)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        connection = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )""")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        connection.commit()
+        _total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries"
+                                          ).fetchone()[0]
+        _connection = connection
+    return _connection
+
+def cache_get(namespace: str, key) -> Optional[str]:
+    """
+    Looks up a cached text.
+
+    ## Parameters
+    namespace: the kind of text stored, e.g. "wikitext".
+    key: the key the text was stored under, e.g. a revision ID.
+    ## Returns
+    the cached text, or None if it is not in the cache.
+    """
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute("SELECT data FROM entries WHERE namespace = ? AND key = ?",
+                                 (namespace, str(key))).fetchone()
+        if row is None:
+            return None
+        # a commit per read costs more than the read; see _flush_touches()
+        _pending_touches[(namespace, str(key))] = time.time()
+        if len(_pending_touches) >= TOUCH_FLUSH_LIMIT:
+            _flush_touches(connection)
+            connection.commit()
+    return zlib.decompress(row[0]).decode("utf-8")
+
+def _flush_touches(connection: sqlite3.Connection):
+    """
+    Writes the access times of the reads since the last flush, without committing.
+    Callers must hold _lock.
+    """
+    if _pending_touches:
+        connection.executemany(
+            "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?",
+            [(accessed, namespace, key) for (namespace, key), accessed in _pending_touches.items()])
+        _pending_touches.clear()
+
+def cache_contains(namespace: str, key) -> bool:
+    """
+    Returns whether a text is cached, without reading it or counting it as used.
+    """
+    with _lock:
+        connection = _get_connection()
+        return connection.execute("SELECT 1 FROM entries WHERE namespace = ? AND key = ?",
+                                  (namespace, str(key))).fetchone() is not None
+
+def cache_put(namespace: str, key, text: str):
+    """
+    Stores a text in the cache, evicting old entries if the cache grows too large.
+
+    ## Parameters
+    namespace: the kind of text stored, e.g. "wikitext".
+    key: the key to store the text under, e.g. a revision ID.
+    text: the text to store.
+    """
+    global _total_bytes
+    data = zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+    with _lock:
+        connection = _get_connection()
+        old = connection.execute("SELECT size FROM entries WHERE namespace = ? AND key = ?",
+                                 (namespace, str(key))).fetchone()
+        _flush_touches(connection)
+        connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                           (namespace, str(key), data, len(data), time.time()))
+        connection.commit()
+        _total_bytes += len(data) - (old[0] if old else 0)
+        if _total_bytes > CACHE_MAX_BYTES:
+            _evict(connection, CACHE_MAX_BYTES)
+
+def _evict(connection: sqlite3.Connection, max_bytes: int):
+    """
+    Deletes the least recently used entries until the cache holds at most max_bytes.
+    Callers must hold _lock.
+    """
+    global _total_bytes
+    _flush_touches(connection) # so recently read entries are not the ones evicted
+    # evict down to 90% so a full cache is not trimmed again on every single put
+    target = int(max_bytes * 0.9)
+    freed = 0
+    doomed = []
+    for namespace, key, size in connection.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY last_access"):
+        if _total_bytes - freed <= target:
+            break
+        doomed.append((namespace, key))
+        freed += size
+    connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", doomed)
+    connection.commit()
+    _total_bytes -= freed
+    print(f"Evicted {len(doomed)} cache entries ({freed} bytes)")
+
+def evict(max_bytes: int = CACHE_MAX_BYTES):
+    """
+    Trims the cache down to max_bytes of compressed text, least recently used first.
+    """
+    with _lock:
+        connection = _get_connection()
+        if _total_bytes > max_bytes:
+            _evict(connection, max_bytes)
+
+def cache_size() -> int:
+    """
+    Returns the compressed size in bytes of everything in the cache.
+    """
+    with _lock:
+        _get_connection()
+        return _total_bytes
+
+def close():
+    """
+    Writes the pending access times and closes the cache file. It is reopened on next use.
+    """
+    global _connection
+    with _lock:
+        if _connection is None:
+            return
+        _flush_touches(_connection)
+        _connection.commit()
+        _connection.close()
+        _connection = None
+
+atexit.register(close)
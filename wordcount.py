@@ -3,7 +3,8 @@ MediaWiki does not include a word counter. I am quickly making one of my own.
 
 This script requires some local files generated by the API calls.
 """
-import os
+import page_files
+import file_stats
 
 SCRAPED_FILES_PATH = "pages/"
 
@@ -11,25 +12,22 @@ mastercount = 0
 
 def count_all_textfiles(path: str):
     """
-    Counts the text count of every .txt file in a given path, including subdirectories.
-    This function only works in folders with only subfolders and text files. Other file types
-    will lead to issues.
+    Counts the text count of every raw text (R) file in a given path, as listed in the
+    file index (see page_files.file_index()), counting the files in parallel (see
+    file_stats.py). Subfolders are not counted.
 
     ## Parameters
     path: a local path to a folder to parse through.
     ## Returns
     the number of all words across all text files in the given folder.
     """
-    count = 0
-    for filename in os.listdir(path):
-        if "R.txt" not in filename:
-            #count += count_all_textfiles(path+filename+"/")
-            continue
-        #else:
-        with open(path + filename, 'r', encoding='utf-8') as f:
-            # no need to parse out wiki formatting b/c I already did that during api calling
-            count += len(f.read().strip().split(" "))
-    return count
+    # no need to parse out wiki formatting b/c I already did that during api calling
+    rawfiles = [entry["R"] for entry in page_files.file_index(path).values()
+                if entry["R"] is not None]
+    return sum(stats["words"] for stats in file_stats.many_file_stats(rawfiles).values())
 
-mastercount = count_all_textfiles(SCRAPED_FILES_PATH)
-print(mastercount)
+# many_file_stats() starts worker processes, which import this module again under the
+# "spawn" start method (Windows, macOS), so the count must not run on import
+if __name__ == "__main__":
+    mastercount = count_all_textfiles(SCRAPED_FILES_PATH)
+    print(mastercount)